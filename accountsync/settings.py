@@ -315,6 +315,7 @@ CELERY_TASK_ROUTES = {
     'syncservice.tasks.sync_hr_persons_task': {'queue': 'hr_sync'},
     'syncservice.tasks.create_account_tasks_task': {'queue': 'account_tasks'},
     'syncservice.tasks.process_account_creation_tasks_task': {'queue': 'account_processing'},
+    'syncservice.tasks.reap_expired_task_leases_task': {'queue': 'account_processing'},
 }
 
 # Beat调度器配置
@@ -333,4 +334,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'syncservice.tasks.process_account_creation_tasks_task',
         'schedule': crontab(minute='*/5'),  # 每5分钟执行一次
     },
+    'reap-expired-task-leases': {
+        'task': 'syncservice.tasks.reap_expired_task_leases_task',
+        'schedule': crontab(minute='*'),  # 每分钟执行一次
+    },
 }
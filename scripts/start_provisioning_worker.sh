@@ -0,0 +1,20 @@
+#!/bin/bash
+
+# 账号开通工作进程启动脚本
+# 常驻运行，持续处理账号创建任务，替代每5分钟一次的 process_account_creation_tasks 定时任务
+# 收到 SIGTERM 后处理完当前一轮再退出
+
+# 设置Django环境变量
+export DJANGO_SETTINGS_MODULE=accountsync.settings
+
+# 启动工作进程
+# --workers   并发执行任务的线程数
+# --max-tasks 每轮最多处理的任务数
+# --min-sleep 有任务时两轮之间的等待秒数
+# --max-sleep 空闲时两轮之间的最长等待秒数
+
+exec python manage.py run_provisioning_worker \
+    --workers=4 \
+    --max-tasks=50 \
+    --min-sleep=1 \
+    --max-sleep=30
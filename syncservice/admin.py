@@ -1,3 +1,5 @@
+import json
+
 from django.contrib import admin, messages
 from django.utils.html import format_html
 from unfold.admin import ModelAdmin, TabularInline
@@ -8,9 +10,11 @@ from unfold.contrib.filters.admin import (
 )
 
 from syncservice.models import (
-    HrPerson, HrPersonAccount, SyncConfig, DepartmentMapping, PersonTypeMapping,
-    AccountCreationTask, AccountCreationLog, AccountCreationRequest, AccountCreationRequestItem
+    HrPerson, HrPersonAccount, HrSyncRun, SyncConfig, DepartmentMapping, PersonTypeMapping,
+    AccountCreationTask, AccountCreationLog, AccountCreationRequest, AccountCreationRequestItem, ProviderCircuit,
+    ServiceToken, EmailAllocation
 )
+from syncservice.breaker import CircuitOpenError
 from syncservice.services import AccountCreationService
 
 
@@ -26,7 +30,8 @@ class HrPersonAdmin(ModelAdmin):
         ('last_update_date', RangeDateFilter),
     ]
     search_fields = ['employee_number', 'full_name', 'english_name']
-    readonly_fields = ['person_id', 'creation_date', 'last_update_date']
+    readonly_fields = ['person_id', 'creation_date', 'last_update_date', 'name_pinyin', 'account_username', 'mail_alias',
+                       'content_hash', 'planning_dirty_at']
     list_per_page = 20  # 人员数据分页
 
     # Unfold specific configurations
@@ -39,6 +44,30 @@ class HrPersonAdmin(ModelAdmin):
     # 显示完整结果计数
     show_full_result_count = True
 
+    def save_model(self, request, obj, form, change):
+        # 手工修改后清空内容摘要，下次HR同步时以HR数据覆盖
+        if change:
+            obj.content_hash = None
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(EmailAllocation)
+class EmailAllocationAdmin(ModelAdmin):
+    list_display = ['localpart', 'domain', 'person', 'base_localpart', 'suffix', 'created_at']
+    list_filter = ['domain']
+    search_fields = ['localpart', 'base_localpart', 'person__employee_number', 'person__full_name']
+    raw_id_fields = ['person']
+    readonly_fields = ['base_localpart', 'suffix', 'created_at']
+    list_per_page = 50
+
+    # Unfold specific configurations
+    compressed_fields = True
+    warn_unsaved_form = True
+    list_fullwidth = True
+
+    # 显示完整结果计数
+    show_full_result_count = True
+
 
 @admin.register(HrPersonAccount)
 class HrPersonAccountAdmin(ModelAdmin):
@@ -108,12 +137,23 @@ class SyncConfigAdmin(ModelAdmin):
     def get_config_category(self, obj):
         """显示配置分类"""
         categories = {
-            'system_config': ['hr_sync_enabled', 'task_auto_creation_enabled', 'task_processing_enabled'],
-            'hr_sync_config': ['hieds_account', 'hieds_secret', 'hieds_project', 'hieds_enterprise', 'hieds_tenant_id', 'hieds_page_size'],
-            'task_config': ['account_creation_max_retries', 'valid_employee_statuses'],
+            'system_config': ['hr_sync_enabled', 'task_auto_creation_enabled', 'task_processing_enabled', 'config_cache_ttl_seconds'],
+            'hr_sync_config': ['hieds_account', 'hieds_secret', 'hieds_project', 'hieds_enterprise', 'hieds_tenant_id', 'hieds_page_size',
+                               'hieds_fetch_workers', 'hieds_rate_limit', 'hieds_rate_burst', 'hieds_page_max_retries',
+                               'hr_sync_resume_max_age_hours', 'hr_sync_stale_minutes',
+                               'hr_sync_watermark_mode', 'hr_sync_watermark_overlap_seconds'],
+            'breaker_config': ['circuit_breaker_failure_threshold', 'circuit_breaker_cooldown_seconds'],
+            'token_config': ['token_refresh_margin_seconds', 'token_refresh_lock_seconds', 'token_local_cache_seconds',
+                             'hieds_token_ttl_seconds'],
+            'http_config': ['http_pool_connections', 'http_pool_maxsize', 'http_connect_timeout',
+                            'http_read_timeout', 'http_max_retries', 'http_retry_backoff'],
+            'task_config': ['account_creation_max_retries', 'account_creation_retry_base_seconds', 'account_creation_retry_max_seconds',
+                            'valid_employee_statuses', 'task_planning_full_interval_minutes',
+                            'account_processing_workers', 'account_task_lease_seconds', 'idaas_max_concurrency', 'welink_max_concurrency', 'email_max_concurrency',
+                            'mapping_snapshot_check_seconds'],
             'idaas_config': ['idaas_account', 'idaas_secret', 'idaas_enterprise_id'],
             'welink_config': ['welink_client_id', 'welink_client_secret'],
-            'email_config': ['email_auth_token']
+            'email_config': ['email_auth_token', 'email_batch_size', 'email_unknown_result_max_defers']
         }
 
         for category, keys in categories.items():
@@ -125,6 +165,87 @@ class SyncConfigAdmin(ModelAdmin):
     get_config_category.admin_order_field = 'key'
 
 
+@admin.register(HrSyncRun)
+class HrSyncRunAdmin(ModelAdmin):
+    list_display = [
+        'run_id', 'mode', 'status', 'last_committed_page', 'total_pages',
+        'inserted_count', 'updated_count', 'unchanged_count', 'failed_count', 'started_at', 'finished_at'
+    ]
+    list_filter = [
+        'mode',
+        'status',
+        ('started_at', RangeDateTimeFilter),
+    ]
+    search_fields = ['run_id', 'error_message']
+    readonly_fields = [
+        'run_id', 'mode', 'page_size', 'start_watermark', 'max_watermark', 'total_pages', 'last_committed_page',
+        'inserted_count', 'updated_count', 'unchanged_count', 'failed_count',
+        'error_message', 'started_at', 'updated_at', 'finished_at'
+    ]
+    list_per_page = 20
+
+    # Unfold specific configurations
+    compressed_fields = True
+    warn_unsaved_form = True
+    list_fullwidth = True
+    list_filter_submit = True
+    list_filter_sheet = False
+
+    # 显示完整结果计数
+    show_full_result_count = True
+
+
+@admin.register(ProviderCircuit)
+class ProviderCircuitAdmin(ModelAdmin):
+    list_display = ['provider', 'state', 'failure_count', 'opened_at', 'retry_at', 'updated_at']
+    list_filter = ['state']
+    readonly_fields = ['provider', 'state', 'failure_count', 'opened_at', 'retry_at', 'last_error', 'updated_at']
+    list_per_page = 20
+
+    # Unfold specific configurations
+    compressed_fields = True
+    warn_unsaved_form = True
+    list_fullwidth = True
+    list_filter_submit = True
+    list_filter_sheet = False
+
+    def reset_circuits(self, request, queryset):
+        """手动恢复选中服务的熔断状态"""
+        updated = queryset.update(state='closed', failure_count=0, retry_at=None)
+        self.message_user(request, f"已恢复 {updated} 个服务", messages.SUCCESS)
+
+    reset_circuits.short_description = '恢复正常'
+    reset_circuits.allowed_permissions = ('change',)
+    actions = [reset_circuits]
+
+
+@admin.register(ServiceToken)
+class ServiceTokenAdmin(ModelAdmin):
+    list_display = ['name', 'expires_at', 'refreshed_at', 'refresh_lock_until', 'updated_at']
+    search_fields = ['name']
+    # token 本身不在后台展示
+    fields = ['name', 'expires_at', 'refreshed_at', 'refresh_lock_until', 'updated_at']
+    readonly_fields = ['name', 'expires_at', 'refreshed_at', 'refresh_lock_until', 'updated_at']
+    list_per_page = 20
+
+    # Unfold specific configurations
+    compressed_fields = True
+    warn_unsaved_form = True
+    list_fullwidth = True
+
+    def has_add_permission(self, request):
+        return False
+
+    def invalidate_tokens(self, request, queryset):
+        """作废选中的 token，下次使用时重新获取"""
+        updated = queryset.update(token=None, expires_at=None, refresh_lock_until=None)
+        self.message_user(request, f"已作废 {updated} 个 token", messages.SUCCESS)
+
+    invalidate_tokens.short_description = '作废 token'
+    invalidate_tokens.allowed_permissions = ('change',)
+    actions = [invalidate_tokens]
+
+
 @admin.register(DepartmentMapping)
 class DepartmentMappingAdmin(ModelAdmin):
     list_display = ['idata_departmentcode', 'idaas_departmentcode', 'ou']
@@ -172,10 +293,18 @@ class PersonTypeMappingAdmin(ModelAdmin):
     )
 
 
+def _format_json(data):
+    """以格式化 JSON 显示"""
+    if data is None:
+        return '-'
+    return format_html('<pre style="white-space: pre-wrap;">{}</pre>', json.dumps(data, ensure_ascii=False, indent=2, default=str))
+
+
 class AccountCreationLogInline(TabularInline):
     """账号创建日志内联显示"""
     model = AccountCreationLog
-    readonly_fields = ['execution_attempt', 'error_message', 'error_details', 'execution_context', 'created_at']
+    readonly_fields = ['execution_attempt', 'error_message', 'get_error_details_display', 'execution_context', 'created_at']
+    fields = readonly_fields
     can_delete = False
     extra = 0
     max_num = 0
@@ -186,6 +315,11 @@ class AccountCreationLogInline(TabularInline):
     # Unfold specific configurations
     compressed_fields = True
 
+    def get_error_details_display(self, obj):
+        """显示完整错误详情（含堆栈），从 TaskPayload 按需加载"""
+        return _format_json(obj.get_full_error_details())
+    get_error_details_display.short_description = '错误详情'
+
 
 @admin.register(AccountCreationTask)
 class AccountCreationTaskAdmin(ModelAdmin):
@@ -202,8 +336,9 @@ class AccountCreationTaskAdmin(ModelAdmin):
     ]
     search_fields = ['task_id', 'person__employee_number', 'person__full_name']
     readonly_fields = [
-        'task_id', 'person', 'account_type', 'result_data',
-        'depends_on_task', 'created_at', 'updated_at', 'completed_at'
+        'task_id', 'person', 'account_type', 'result_data', 'get_result_payload_display',
+        'depends_on_task', 'attempt_count', 'unknown_result_count', 'next_attempt_at', 'claimed_by', 'claimed_at', 'lease_expires_at',
+        'created_at', 'updated_at', 'completed_at'
     ]
     raw_id_fields = ['person', 'depends_on_task']
     list_per_page = 25  # 任务数据分页
@@ -219,38 +354,41 @@ class AccountCreationTaskAdmin(ModelAdmin):
     show_full_result_count = True
 
     def get_queryset(self, request):
-        """优化查询，预计算重试次数并预加载日志数据避免 N+1 查询"""
+        """优化查询，预加载人员数据避免 N+1 查询"""
         queryset = super().get_queryset(request)
-        # 使用 annotate 预计算重试次数
-        from django.db.models import Count
-        return queryset.annotate(
-            retry_count_annotated=Count('error_logs')
-        ).select_related('person').prefetch_related('error_logs')
+        return queryset.select_related('person')
 
     def get_retry_count_display(self, obj):
-        """显示预计算的重试次数"""
-        return getattr(obj, 'retry_count_annotated', 0)
-    get_retry_count_display.short_description = '重试次数'
+        """显示重试次数"""
+        return obj.attempt_count
     get_retry_count_display.short_description = '重试次数'
-    get_retry_count_display.admin_order_field = 'retry_count_annotated'
+    get_retry_count_display.admin_order_field = 'attempt_count'
+
+    def get_result_payload_display(self, obj):
+        """显示外部服务原始响应，只在详情页从 TaskPayload 按需加载"""
+        return _format_json(obj.get_result_payload())
+    get_result_payload_display.short_description = '服务响应'
 
     def retry_failed_tasks(self, request, queryset):
         """重试失败的任务并立即执行账号创建"""
         service = AccountCreationService()
         success_count = 0
         failed_count = 0
-        skipped_count = 0
         errors = []
 
-        for task in queryset:
-            try:
-                if task.status != 'failed':
-                    skipped_count += 1
-                    continue
+        tasks = list(queryset)
+        failed_tasks = [task for task in tasks if task.status == 'failed']
+        skipped_count = len(tasks) - len(failed_tasks)
 
-                # 标记为处理中
-                task.mark_processing()
+        worker_id = f'admin:{request.user.get_username()}'
+        for task in failed_tasks:
+            # 逐个原子认领，避免与正在运行的任务处理进程重复执行；
+            # 一次只持有一个任务的租约，后面的任务不会在等待期间因租约过期被回收
+            if not AccountCreationTask.claim([task], worker_id):
+                skipped_count += 1
+                continue
 
+            try:
                 # 获取部门代码
                 department_code = self._get_department_code(task.person)
 
@@ -268,6 +406,11 @@ class AccountCreationTaskAdmin(ModelAdmin):
 
                 success_count += 1
 
+            except CircuitOpenError as e:
+                # 服务熔断时未发出调用，推迟任务且不计入尝试次数
+                task.defer(e.retry_at)
+                skipped_count += 1
+
             except Exception as e:
                 # 标记为失败并记录错误日志
                 task.mark_failed(str(e))
@@ -342,7 +485,7 @@ class AccountCreationTaskAdmin(ModelAdmin):
     # 批量状态修改操作
     def bulk_set_pending(self, request, queryset):
         """批量将选中的任务设为待处理状态"""
-        updated = queryset.update(status='pending')
+        updated = queryset.update(status='pending', next_attempt_at=None)
         self.message_user(
             request,
             f"成功将 {updated} 个任务设为待处理状态",
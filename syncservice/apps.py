@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class SyncserviceConfig(AppConfig):
     name = 'syncservice'
+
+    def ready(self):
+        # 注册映射变更信号
+        from syncservice import signals  # noqa: F401
@@ -0,0 +1,114 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+import requests
+from django.db.models import F, Q
+from django.utils import timezone
+
+from syncservice.models import ProviderCircuit
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """外部服务处于熔断状态，本次调用未发出"""
+
+    def __init__(self, provider: str, retry_at: datetime):
+        self.provider = provider
+        self.retry_at = retry_at
+        super().__init__(f'{provider} 服务熔断中，{timezone.localtime(retry_at):%Y-%m-%d %H:%M:%S} 后再尝试')
+
+
+class CircuitBreaker:
+    """外部服务熔断器
+
+    状态保存在 ProviderCircuit 表中，多个执行进程共享。连续失败达到阈值后熔断，
+    冷却期内的调用直接抛出 CircuitOpenError；冷却结束后只有抢到探测权的一个调用会真正发出（半开），
+    探测成功则恢复，失败则重新熔断。
+    只有网络异常和 5xx 响应计为失败，业务错误说明服务本身可用。
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = 5, cooldown_seconds: float = 60):
+        self.provider = provider
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.cooldown_seconds = cooldown_seconds
+
+    @classmethod
+    def from_config(cls, provider: str) -> 'CircuitBreaker':
+        """根据 SyncConfig 创建熔断器"""
+        from syncservice.services import ConfigService
+        return cls(
+            provider,
+            failure_threshold=ConfigService.get_int_config('circuit_breaker_failure_threshold', 5),
+            cooldown_seconds=ConfigService.get_float_config('circuit_breaker_cooldown_seconds', 60),
+        )
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """通过熔断器调用外部服务"""
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure(e)
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def before_call(self):
+        """检查是否允许调用，不允许时抛出 CircuitOpenError"""
+        circuit = self._get_circuit()
+        if circuit.state == 'closed':
+            return
+
+        now = timezone.now()
+        if circuit.retry_at and circuit.retry_at > now:
+            raise CircuitOpenError(self.provider, circuit.retry_at)
+
+        # 冷却结束（或上一次探测超时），比较并交换抢占探测权，只有一个调用能成功
+        probe_deadline = now + timedelta(seconds=self.cooldown_seconds)
+        acquired = ProviderCircuit.objects.filter(
+            pk=circuit.pk, state=circuit.state, retry_at=circuit.retry_at
+        ).update(state='half_open', retry_at=probe_deadline, updated_at=now)
+
+        if not acquired:
+            raise CircuitOpenError(self.provider, probe_deadline)
+
+        logger.info(f'{self.provider} 服务熔断冷却结束，发起探测调用')
+
+    def record_success(self):
+        """调用成功，恢复正常状态"""
+        recovered = ProviderCircuit.objects.filter(provider=self.provider).exclude(
+            state='closed', failure_count=0
+        ).update(state='closed', failure_count=0, retry_at=None, updated_at=timezone.now())
+
+        if recovered:
+            logger.info(f'{self.provider} 服务恢复正常')
+
+    def record_failure(self, error: Exception):
+        """调用失败，探测失败或连续失败达到阈值时熔断"""
+        now = timezone.now()
+        circuits = ProviderCircuit.objects.filter(provider=self.provider)
+        circuits.update(failure_count=F('failure_count') + 1, last_error=str(error)[:1000], updated_at=now)
+
+        opened = circuits.filter(
+            Q(state='half_open') | Q(state='closed', failure_count__gte=self.failure_threshold)
+        ).update(state='open', opened_at=now, retry_at=now + timedelta(seconds=self.cooldown_seconds), updated_at=now)
+
+        if opened:
+            logger.warning(f'{self.provider} 服务熔断 {self.cooldown_seconds} 秒: {error}')
+
+    @staticmethod
+    def is_failure(error: Exception) -> bool:
+        """只有网络异常和 5xx 响应计为服务故障"""
+        if isinstance(error, requests.HTTPError):
+            response = error.response
+            return response is None or response.status_code >= 500
+        return isinstance(error, requests.RequestException)
+
+    def _get_circuit(self) -> ProviderCircuit:
+        circuit, _ = ProviderCircuit.objects.get_or_create(provider=self.provider)
+        return circuit
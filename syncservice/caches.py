@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from syncservice.models import DepartmentMapping, PersonTypeMapping, SyncConfig
+
+logger = logging.getLogger(__name__)
+
+
+class MappingSnapshot:
+    """部门映射和人员类型映射的进程内快照
+
+    两张映射表数据量小、很少变更，整表加载到内存后查询都是字典命中。
+    映射变更时由信号更新 SyncConfig 中的版本号，快照每隔 check_interval 秒比对一次版本，
+    版本变化时整表重新加载，后台修改几秒内在所有进程生效。
+    """
+
+    VERSION_KEY = 'mapping_version'
+
+    def __init__(self, check_interval: float = 5):
+        self.check_interval = check_interval
+        self._version = None
+        self._checked_at = None
+        self._departments: Dict[str, DepartmentMapping] = {}
+        self._person_types: Dict[str, PersonTypeMapping] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> 'MappingSnapshot':
+        """根据 SyncConfig 创建映射快照"""
+        from syncservice.services import ConfigService
+        return cls(check_interval=ConfigService.get_float_config('mapping_snapshot_check_seconds', 5))
+
+    def get_department_mapping(self, department_code: str) -> Optional[DepartmentMapping]:
+        """按 iData 部门代码获取部门映射"""
+        self._ensure_fresh()
+        return self._departments.get(department_code)
+
+    def get_person_type_mapping(self, person_type: str) -> Optional[PersonTypeMapping]:
+        """获取启用的人员类型映射"""
+        self._ensure_fresh()
+        return self._person_types.get(person_type)
+
+    def invalidate(self):
+        """下次查询时立即比对版本"""
+        with self._lock:
+            self._checked_at = None
+
+    @classmethod
+    def bump_version(cls):
+        """更新映射版本号，各进程的快照在下次比对时重新加载"""
+        SyncConfig.set_config(cls.VERSION_KEY, uuid.uuid4().hex, '映射表版本号，部门映射或人员类型映射变更时自动更新')
+
+    def _ensure_fresh(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+
+            # 先读版本再加载数据，加载期间发生的变更会在下次比对时发现
+            version = SyncConfig.get_config(self.VERSION_KEY, '')
+            if self._version is not None and version == self._version:
+                return
+
+            self._departments = {
+                mapping.idata_departmentcode: mapping for mapping in DepartmentMapping.objects.all()
+            }
+            self._person_types = {
+                mapping.person_type: mapping for mapping in PersonTypeMapping.objects.filter(is_active=True)
+            }
+            self._version = version
+            logger.debug(f'映射快照已加载: 部门映射 {len(self._departments)} 条，人员类型映射 {len(self._person_types)} 条')
+
+
+class ConfigCache:
+    """SyncConfig 的进程内缓存
+
+    一次查询加载整张配置表，ttl_seconds 后过期重新加载；本进程保存配置时由信号立即作废。
+    解析后的布尔/整数/JSON 值按 (键, 解析函数) 缓存，重复读取不再解析。
+    同步时间、水位等需要读取最新值的状态键应直接使用 SyncConfig.get_config。
+    """
+
+    # 缓存有效期的配置键，从已加载的配置表中读取
+    TTL_KEY = 'config_cache_ttl_seconds'
+    DEFAULT_TTL_SECONDS = 30
+
+    # 表中没有该键或解析失败
+    MISSING = object()
+
+    def __init__(self, ttl_seconds: float = None):
+        # 为 None 时按配置表中的 config_cache_ttl_seconds
+        self.ttl_seconds = ttl_seconds
+        # (原始值, 解析结果) 一起替换，解析结果始终与原始值对应
+        self._state: Tuple[Dict[str, str], Dict[Tuple[str, Callable], Any]] = ({}, {})
+        self._expires_at = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """返回配置原始值，表中没有时返回 None"""
+        values, _ = self._load()
+        return values.get(key)
+
+    def get_parsed(self, key: str, parse: Callable[[str], Any]) -> Any:
+        """返回解析后的配置值，表中没有或解析失败时返回 ConfigCache.MISSING"""
+        values, parsed_values = self._load()
+        cache_key = (key, parse)
+        if cache_key in parsed_values:
+            return parsed_values[cache_key]
+
+        parsed = self.MISSING
+        if key in values:
+            try:
+                parsed = parse(values[key])
+            except (ValueError, TypeError):
+                pass
+        parsed_values[cache_key] = parsed
+        return parsed
+
+    def invalidate(self):
+        """下次读取时重新加载"""
+        with self._lock:
+            self._expires_at = None
+
+    def _load(self) -> Tuple[Dict[str, str], Dict[Tuple[str, Callable], Any]]:
+        expires_at = self._expires_at
+        if expires_at is not None and time.monotonic() < expires_at:
+            return self._state
+
+        with self._lock:
+            if self._expires_at is not None and time.monotonic() < self._expires_at:
+                return self._state
+
+            values = dict(SyncConfig.objects.values_list('key', 'value'))
+            ttl_seconds = self.ttl_seconds
+            if ttl_seconds is None:
+                try:
+                    ttl_seconds = float(values.get(self.TTL_KEY, self.DEFAULT_TTL_SECONDS))
+                except (ValueError, TypeError):
+                    ttl_seconds = self.DEFAULT_TTL_SECONDS
+
+            self._state = (values, {})
+            self._expires_at = time.monotonic() + ttl_seconds
+            return self._state
+
+
+_config_cache = ConfigCache()
+
+
+def get_config_cache() -> ConfigCache:
+    """获取进程内共享的配置缓存"""
+    return _config_cache
+
+
+_snapshot: Optional[MappingSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_mapping_snapshot() -> MappingSnapshot:
+    """获取进程内共享的映射快照"""
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = MappingSnapshot.from_config()
+    return _snapshot
+
+
+def invalidate_mapping_snapshot():
+    """更新映射版本号，并让本进程的快照立即重新比对"""
+    MappingSnapshot.bump_version()
+    if _snapshot is not None:
+        _snapshot.invalidate()
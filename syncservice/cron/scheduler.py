@@ -3,8 +3,9 @@ from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 import logging
-import json
-from syncservice.models import HrPerson, AccountCreationTask, SyncConfig
+from syncservice.models import HrPerson, AccountCreationTask
+from syncservice.planner import AccountTaskPlanner
+from syncservice.services import ConfigService
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +13,9 @@ logger = logging.getLogger(__name__)
 class AccountTaskCreator:
     """账号任务创建器"""
 
+    # 这些状态的任务视为已存在，失败的任务会重新创建
+    ACTIVE_TASK_STATUSES = ['pending', 'processing', 'completed']
+
     def create_pending_tasks(self):
         """创建待处理的账号任务"""
         valid_statuses = self._get_valid_employee_statuses()
@@ -25,41 +29,45 @@ class AccountTaskCreator:
 
         created_count = 0
 
-        for person in target_persons:
-            try:
-                # 获取部门代码
-                department_code = self._get_department_code(person)
-                if not department_code:
-                    continue
+        # 与 create_account_tasks 共用同一个规划器，一条查询找出缺失任务的人员
+        planner = AccountTaskPlanner(['idaas', 'welink', 'email'], task_statuses=self.ACTIVE_TASK_STATUSES)
+
+        for chunk in planner.iter_missing(target_persons):
+            for person in chunk:
+                try:
+                    # 获取部门代码
+                    department_code = self._get_department_code(person)
+                    if not department_code:
+                        continue
 
-                # 创建IDAAS任务
-                if self._needs_account_creation(person, 'idaas'):
-                    self._create_task(person, 'idaas', department_code)
-                    created_count += 1
+                    missing_account_types = person.missing_account_types
+                    idaas_task = None
 
-                # 创建Welink任务
-                if self._needs_account_creation(person, 'welink'):
-                    self._create_task(person, 'welink', department_code)
-                    created_count += 1
+                    # 创建IDAAS任务
+                    if 'idaas' in missing_account_types:
+                        idaas_task = self._create_task(person, 'idaas', department_code)
+                        created_count += 1
 
-                # 创建Email任务（依赖IDAAS任务）
-                if self._needs_account_creation(person, 'email'):
-                    idaas_task = self._get_existing_task(person, 'idaas')
-                    self._create_task(person, 'email', department_code, depends_on=idaas_task)
-                    created_count += 1
+                    # 创建Welink任务
+                    if 'welink' in missing_account_types:
+                        self._create_task(person, 'welink', department_code)
+                        created_count += 1
 
-            except Exception as e:
-                logger.error(f"为人员 {person.employee_number} 创建任务失败: {e}")
+                    # 创建Email任务（依赖IDAAS任务）
+                    if 'email' in missing_account_types:
+                        if idaas_task is None:
+                            idaas_task = self._get_existing_task(person, 'idaas')
+                        self._create_task(person, 'email', department_code, depends_on=idaas_task)
+                        created_count += 1
+
+                except Exception as e:
+                    logger.error(f"为人员 {person.employee_number} 创建任务失败: {e}")
 
         return created_count
 
     def _get_valid_employee_statuses(self):
         """获取有效的员工状态列表"""
-        config_value = SyncConfig.get_config('valid_employee_statuses', '["1"]')
-        try:
-            return json.loads(config_value)
-        except (json.JSONDecodeError, TypeError):
-            return ['1']
+        return ConfigService.get_json_config('valid_employee_statuses', ['1'])
 
     def _get_department_code(self, person):
         """从人员信息中提取部门代码"""
@@ -72,21 +80,13 @@ class AccountTaskCreator:
 
         return None
 
-    def _needs_account_creation(self, person, account_type):
-        """检查是否需要创建账号"""
-        return not AccountCreationTask.objects.filter(
-            person=person,
-            account_type=account_type,
-            status__in=['pending', 'processing', 'completed']
-        ).exists()
-
     def _get_existing_task(self, person, account_type):
         """获取已存在的任务（用于依赖关系）"""
         try:
             return AccountCreationTask.objects.get(
                 person=person,
                 account_type=account_type,
-                status__in=['pending', 'processing', 'completed']
+                status__in=self.ACTIVE_TASK_STATUSES
             )
         except AccountCreationTask.DoesNotExist:
             return None
@@ -138,8 +138,7 @@ class TaskCreationScheduler:
 
     def _is_enabled(self):
         """检查是否启用任务自动创建"""
-        config_value = SyncConfig.get_config('task_auto_creation_enabled', 'true')
-        return config_value.lower() == 'true'
+        return ConfigService.get_bool_config('task_auto_creation_enabled', True)
 
 
 class HrSyncScheduler:
@@ -172,8 +171,7 @@ class HrSyncScheduler:
 
     def _is_sync_enabled(self):
         """检查是否启用HR同步"""
-        config_value = SyncConfig.get_config('hr_sync_enabled', 'true')
-        return config_value.lower() == 'true'
+        return ConfigService.get_bool_config('hr_sync_enabled', True)
 
 
 class AccountCreationScheduler:
@@ -206,8 +204,7 @@ class AccountCreationScheduler:
 
     def _is_enabled(self):
         """检查是否启用任务处理"""
-        config_value = SyncConfig.get_config('task_processing_enabled', 'true')
-        return config_value.lower() == 'true'
+        return ConfigService.get_bool_config('task_processing_enabled', True)
 
 
 # 全局调度器实例
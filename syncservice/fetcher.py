@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from django.db import connection
+
+from syncservice.services import ConfigService
+
+logger = logging.getLogger(__name__)
+
+
+class PageFetchError(Exception):
+    """分页数据在重试后仍获取失败"""
+
+    def __init__(self, page: int, attempts: int):
+        self.page = page
+        self.attempts = attempts
+        super().__init__(f'第{page}页数据获取失败（已尝试 {attempts} 次）')
+
+
+class TokenBucket:
+    """令牌桶限流器（线程安全），多个拉取线程共享同一个实例"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = max(float(rate), 0.001)
+        self.capacity = max(float(capacity or rate), 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, prefix: str, default_rate: float = 2.0, default_burst: float = 2.0) -> 'TokenBucket':
+        """根据 SyncConfig 创建限流器，读取 {prefix}_rate_limit 和 {prefix}_rate_burst"""
+        rate = ConfigService.get_float_config(f'{prefix}_rate_limit', default_rate)
+        burst = ConfigService.get_float_config(f'{prefix}_rate_burst', default_burst)
+        return cls(rate, burst)
+
+    def acquire(self, tokens: float = 1.0):
+        """获取令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait_seconds = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait_seconds)
+
+
+class PageFetcher:
+    """分页并发拉取引擎
+
+    先拉取起始页读取 pageInfo.totalPages，再用有界线程池拉取剩余页面。
+    结果严格按页码顺序产出，调用方可以在主线程中按确定顺序写库。
+    """
+
+    def __init__(self, fetch_page: Callable[[int], Optional[Dict[str, Any]]], workers: int = 4,
+                 rate_limiter: TokenBucket = None, max_retries: int = 3, retry_backoff: float = 1.0):
+        self.fetch_page = fetch_page
+        self.workers = max(int(workers), 1)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max(int(max_retries), 0)
+        self.retry_backoff = retry_backoff
+
+    def fetch_all(self, start_page: int = 1) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """按页码顺序产出 (页码, 页面数据)，某页重试耗尽时抛出 PageFetchError"""
+        first_page = self._fetch_with_retry(start_page)
+        yield start_page, first_page
+
+        total_pages = first_page.get('pageInfo', {}).get('totalPages', 0) or 0
+        if start_page >= total_pages:
+            return
+
+        pages = iter(range(start_page + 1, total_pages + 1))
+        # 限制已提交但未消费的页数，避免结果在内存中堆积
+        window = self.workers * 2
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hr-page-fetch') as executor:
+            in_flight = []
+            try:
+                for page in pages:
+                    in_flight.append((page, executor.submit(self._fetch_in_thread, page)))
+                    if len(in_flight) >= window:
+                        break
+
+                while in_flight:
+                    page, future = in_flight.pop(0)
+                    data = future.result()
+
+                    next_page = next(pages, None)
+                    if next_page is not None:
+                        in_flight.append((next_page, executor.submit(self._fetch_in_thread, next_page)))
+
+                    yield page, data
+            finally:
+                for _, future in in_flight:
+                    future.cancel()
+
+    def _fetch_in_thread(self, page: int) -> Dict[str, Any]:
+        """拉取线程入口，拉取结束后关闭本线程的数据库连接（token 未命中本地缓存时会读写数据库）"""
+        try:
+            return self._fetch_with_retry(page)
+        finally:
+            connection.close()
+
+    def _fetch_with_retry(self, page: int) -> Dict[str, Any]:
+        """拉取单页，失败时按退避重试"""
+        attempts = 0
+        while True:
+            attempts += 1
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            try:
+                data = self.fetch_page(page)
+            except Exception as e:
+                logger.warning(f'第{page}页数据获取异常（第{attempts}次）: {e}')
+                data = None
+
+            if data is not None:
+                return data
+
+            if attempts > self.max_retries:
+                raise PageFetchError(page, attempts)
+
+            time.sleep(self.retry_backoff * (2 ** (attempts - 1)))
@@ -0,0 +1,63 @@
+import logging
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+try:
+    import pypinyin
+    PYPINYIN_AVAILABLE = True
+except ImportError:
+    PYPINYIN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4096)
+def _lazy_pinyin(full_name: str) -> Tuple[str, ...]:
+    """姓名的拼音列表 ('zhang', 'san')，按姓名缓存"""
+    return tuple(pypinyin.lazy_pinyin(full_name, style=pypinyin.Style.NORMAL))
+
+
+def convert_to_pinyin(full_name: str) -> str:
+    """将中文名转换为拼音"""
+    if not PYPINYIN_AVAILABLE:
+        # 如果没有 pypinyin，使用原名作为降级方案
+        logger.warning("pypinyin 未安装，使用简化的拼音转换")
+        return full_name
+
+    try:
+        return ''.join(_lazy_pinyin(full_name))
+    except Exception as e:
+        logger.error(f"拼音转换失败: {full_name}, 错误: {e}")
+        return full_name
+
+
+def generate_username(employee_number: str, full_name: str) -> str:
+    """生成用户名：姓名首字母 + 员工编号"""
+    if not PYPINYIN_AVAILABLE:
+        logger.warning("pypinyin 未安装，无法生成拼音用户名")
+        return f"{employee_number}"
+
+    try:
+        pinyin_list = _lazy_pinyin(full_name)
+        # 只取第一个字的首字母
+        first_initial = pinyin_list[0][0] if pinyin_list and pinyin_list[0] else ''
+        return f"{first_initial}{employee_number}"
+    except Exception as e:
+        logger.error(f"用户名生成失败: {full_name}, 错误: {e}")
+        return f"{employee_number}"
+
+
+def compute_identity_fields(employee_number: str, full_name: str) -> Dict[str, Optional[str]]:
+    """入库时预先计算的拼音、用户名和邮箱别名
+
+    pypinyin 不可用或姓名为空时返回空值，开户时再按需计算，避免把降级结果写入数据库。
+    """
+    if not PYPINYIN_AVAILABLE or not full_name:
+        return {'name_pinyin': None, 'account_username': None, 'mail_alias': None}
+
+    name_pinyin = convert_to_pinyin(full_name)
+    return {
+        'name_pinyin': name_pinyin,
+        'account_username': generate_username(employee_number, full_name),
+        'mail_alias': name_pinyin.lower(),
+    }
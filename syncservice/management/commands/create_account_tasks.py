@@ -1,8 +1,11 @@
 import os
 import logging
+from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils import timezone
-from syncservice.models import HrPerson, AccountCreationTask, SyncConfig, AccountCreationRequest, AccountCreationRequestItem
+from syncservice.models import HrPerson, SyncConfig, AccountCreationRequest, AccountCreationRequestItem
+from syncservice.planner import AccountTaskMaterializer, AccountTaskPlanner
 from syncservice.services import ConfigService
 
 logger = logging.getLogger(__name__)
@@ -22,6 +25,11 @@ class Command(BaseCommand):
             nargs='+',
             help='指定员工状态，多个状态用空格分隔',
         )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='全量规划：评估所有符合条件的员工，而不仅是新增或状态变化的员工',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -52,18 +60,31 @@ class Command(BaseCommand):
             # 获取系统配置中启用的账号类型
             enabled_account_types = self._get_enabled_account_types()
 
+            # 平时只评估待规划的员工，定期做一次全量核对兜底
+            full_planning = options['full'] or self._is_full_planning_due()
+            planning_started_at = timezone.now()
+            # 本轮开始时已提交的待规划标记，结束时只清除这些标记
+            dirty_marks = self._get_dirty_marks()
+            if full_planning:
+                self.stdout.write('规划模式: 全量')
+            else:
+                persons_query = persons_query.filter(pk__in=list(dirty_marks))
+                self.stdout.write('规划模式: 增量（仅新增或状态变化的员工）')
+
             total_persons = persons_query.count()
             self.stdout.write(f'找到 {total_persons} 个符合条件的员工')
 
+            # 一条查询找出缺少任务的员工，按块处理
+            planner = AccountTaskPlanner(enabled_account_types)
+
             if dry_run:
                 self.stdout.write('\n=== 预览模式 - 以下是将被创建的任务 ===')
                 total_tasks = 0
 
-                for person in persons_query:
-                    tasks_for_person = self._get_tasks_for_person(person, enabled_account_types)
-                    if tasks_for_person:
+                for chunk in planner.iter_missing(persons_query):
+                    for person in chunk:
                         self.stdout.write(f'员工 {person.employee_number} ({person.full_name}):')
-                        for account_type in tasks_for_person:
+                        for account_type in person.missing_account_types:
                             self.stdout.write(f'  - {account_type}')
                             total_tasks += 1
 
@@ -71,19 +92,18 @@ class Command(BaseCommand):
                 self.stdout.write(f'\n账号创建请求总计将创建 {created_tasks_for_requests} 个账号任务')
                 return
 
-            # 执行模式
+            # 执行模式：每块人员的任务在一个事务中批量创建
             created_tasks = []
+            materializer = AccountTaskMaterializer()
 
-            for person in persons_query:
-                tasks_for_person = self._get_tasks_for_person(person, enabled_account_types)
-                if not tasks_for_person:
-                    continue
+            for chunk in planner.iter_missing(persons_query):
+                chunk_tasks = materializer.materialize((person, person.missing_account_types) for person in chunk)
+                created_tasks.extend(chunk_tasks)
 
-                # 为员工创建账号任务
-                person_tasks = self._create_tasks_for_person(person, tasks_for_person)
-                created_tasks.extend(person_tasks)
+                for person in chunk:
+                    self.stdout.write(f'为员工 {person.employee_number} ({person.full_name}) 创建了 {len(person.missing_account_types)} 个任务')
 
-                self.stdout.write(f'为员工 {person.employee_number} ({person.full_name}) 创建了 {len(person_tasks)} 个任务')
+            self._finish_planning(full_planning, planning_started_at, dirty_marks, employee_status_filter, persons_query)
 
             total_created = len(created_tasks) + created_tasks_for_requests
             self.stdout.write(
@@ -123,17 +143,23 @@ class Command(BaseCommand):
                     self._update_request_status(request)
                 continue
 
-            # 为这些用户创建账号任务
+            # 一次查询获取这些用户缺失的任务类型
+            items = list(items.select_related('hr_person'))
+            planner = AccountTaskPlanner(request.system_list)
+            missing_map = planner.get_missing_map(item.hr_person_id for item in items if item.hr_person_id)
+
+            # 收集需要创建任务的用户
             request_task_count = 0
+            plans = []
+            planned_items = []
             for item in items:
                 if not item.hr_person:
                     continue
 
                 person = item.hr_person
-                system_list = request.system_list
 
-                # 获取需要创建的任务类型
-                tasks_for_person = self._get_tasks_for_person(person, system_list)
+                # 获取需要创建的任务类型（同一人员出现在多个请求项时只创建一次）
+                tasks_for_person = missing_map.pop(person.pk, None)
                 if not tasks_for_person:
                     continue
 
@@ -141,15 +167,20 @@ class Command(BaseCommand):
                     self.stdout.write(f'  预览: 为 {person.employee_number} 创建任务: {", ".join(tasks_for_person)}')
                     request_task_count += len(tasks_for_person)
                 else:
-                    # 创建账号任务
-                    person_tasks = self._create_tasks_for_person(person, tasks_for_person)
-                    request_task_count += len(person_tasks)
+                    plans.append((person, tasks_for_person))
+                    planned_items.append(item)
 
-                    # 更新请求项状态
-                    item.status = 'task_created'
-                    item.save()
+            if plans:
+                # 批量创建账号任务，并在同一事务中更新请求项状态
+                with transaction.atomic():
+                    request_tasks = AccountTaskMaterializer().materialize(plans)
+                    AccountCreationRequestItem.objects.filter(
+                        pk__in=[item.pk for item in planned_items]
+                    ).update(status='task_created', updated_at=timezone.now())
+                request_task_count += len(request_tasks)
 
-                    self.stdout.write(f'  为 {person.employee_number} 创建了 {len(person_tasks)} 个任务')
+                for person, tasks_for_person in plans:
+                    self.stdout.write(f'  为 {person.employee_number} 创建了 {len(tasks_for_person)} 个任务')
 
             total_created += request_task_count
 
@@ -175,60 +206,50 @@ class Command(BaseCommand):
                 request.update_status('completed')
             self.stdout.write(f'请求 {request.request_id} 状态已更新为: {request.get_status_display()}')
 
+    def _is_full_planning_due(self):
+        """距离上次全量规划超过配置的间隔时需要全量规划"""
+        interval_minutes = ConfigService.get_int_config('task_planning_full_interval_minutes', 1440)
+        last_full_planning_time = SyncConfig.get_config('last_full_planning_time')
+        if not last_full_planning_time:
+            return True
+
+        try:
+            last_time = datetime.fromisoformat(last_full_planning_time)
+        except ValueError:
+            return True
+        if timezone.is_naive(last_time):
+            last_time = timezone.make_aware(last_time)
+
+        return timezone.now() - last_time >= timedelta(minutes=interval_minutes)
+
+    def _get_dirty_marks(self):
+        """获取当前已提交的待规划标记 {员工主键: 标记时间}"""
+        return dict(HrPerson.objects.filter(planning_dirty_at__isnull=False).values_list('pk', 'planning_dirty_at'))
+
+    def _finish_planning(self, full_planning, planning_started_at, dirty_marks, employee_status_filter, persons_query):
+        """清除本轮已评估员工的待规划标记
+
+        只清除本轮开始时读到的标记，且标记时间未变；规划期间才提交或重新标记的员工留到下一轮。
+        使用默认员工状态时，不符合条件的员工也视为已评估，等状态再次变化时会被重新标记。
+        """
+        # 同一页同步的员工标记时间相同，按标记时间分组清除
+        marks_by_time = {}
+        for pk, dirty_at in dirty_marks.items():
+            marks_by_time.setdefault(dirty_at, []).append(pk)
+
+        cleared = 0
+        for dirty_at, pks in marks_by_time.items():
+            dirty_persons = HrPerson.objects.filter(pk__in=pks, planning_dirty_at=dirty_at)
+            if employee_status_filter:
+                dirty_persons = dirty_persons.filter(pk__in=persons_query.values('pk'))
+            cleared += dirty_persons.update(planning_dirty_at=None)
+        self.stdout.write(f'清除待规划标记: {cleared} 个员工')
+
+        if full_planning and not employee_status_filter:
+            SyncConfig.set_config('last_full_planning_time', planning_started_at.isoformat(), '上次全量任务规划时间')
+
     def _get_enabled_account_types(self):
         """获取启用的账号类型"""
         # 从配置中获取启用的账号类型，默认启用所有
         enabled_types = ConfigService.get_config('enabled_account_types', 'idaas,welink,email')
         return [t.strip() for t in enabled_types.split(',')]
-
-    def _get_tasks_for_person(self, person, enabled_account_types):
-        """获取为指定人员需要创建的任务类型"""
-        tasks_to_create = []
-
-        for account_type in enabled_account_types:
-            # 检查是否已存在该类型的任务
-            existing_task = AccountCreationTask.objects.filter(
-                person=person,
-                account_type=account_type,
-            ).exists()
-
-            if not existing_task:
-                tasks_to_create.append(account_type)
-
-        return tasks_to_create
-
-    def _create_tasks_for_person(self, person, account_types):
-        """为指定人员创建账号任务"""
-        created_tasks = []
-
-        # 定义账号创建顺序
-        account_order = {
-            'idaas': 1,
-            'welink': 2,
-            'email': 3
-        }
-
-        # 按顺序排序
-        sorted_account_types = sorted(account_types, key=lambda x: account_order.get(x, 999))
-
-        previous_task = None
-
-        for account_type in sorted_account_types:
-            # 生成唯一的任务ID
-            timestamp = timezone.now().timestamp()
-            task_id = f"{person.employee_number}_{account_type}_{int(timestamp)}"
-
-            # 创建任务
-            task = AccountCreationTask.objects.create(
-                task_id=task_id,
-                person=person,
-                account_type=account_type,
-                depends_on_task=previous_task
-            )
-
-            created_tasks.append(task)
-            previous_task = task
-
-            logger.info(f'创建任务: {task_id} - {person.employee_number} - {account_type}')
-
-        return created_tasks
\ No newline at end of file
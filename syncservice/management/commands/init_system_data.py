@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from syncservice.models import SyncConfig, PersonTypeMapping
+from syncservice.models import SyncConfig, PersonTypeMapping, AccountCreationTask, EmailAllocation
 
 
 class Command(BaseCommand):
@@ -14,6 +14,12 @@ class Command(BaseCommand):
         # 第二阶段：初始化人员类型映射
         self._init_person_type_mappings()
 
+        # 第三阶段：回填旧任务的尝试次数
+        self._backfill_task_attempt_counts()
+
+        # 第四阶段：回填已开通的邮箱地址
+        self._seed_email_allocations()
+
         # 输出最终统计
         total_configs = SyncConfig.objects.count()
         total_mappings = PersonTypeMapping.objects.count()
@@ -37,6 +43,7 @@ class Command(BaseCommand):
                 ('hr_sync_enabled', 'false', '是否启用HR数据同步'),
                 ('task_auto_creation_enabled', 'false', '是否启用账号任务自动创建'),
                 ('task_processing_enabled', 'false', '是否启用账号任务处理'),
+                ('config_cache_ttl_seconds', '30', '配置缓存有效期（秒），其他进程修改的配置最迟在该时间后生效'),
             ],
 
             # HR同步配置
@@ -47,12 +54,53 @@ class Command(BaseCommand):
                 ('hieds_enterprise', 'your_enterprise', 'HIEDS企业标识'),
                 ('hieds_tenant_id', 'your_tenant_id', 'HIEDS租户ID'),
                 ('hieds_page_size', '20', 'HIEDS分页大小'),
+                ('hieds_fetch_workers', '4', 'HIEDS分页并发拉取线程数'),
+                ('hieds_rate_limit', '2', 'HIEDS接口限流速率（每秒请求数）'),
+                ('hieds_rate_burst', '2', 'HIEDS接口限流突发容量'),
+                ('hieds_page_max_retries', '3', 'HIEDS单页获取失败最大重试次数'),
+                ('hr_sync_resume_max_age_hours', '24', '未完成的HR同步可续传的最长时间（小时）'),
+                ('hr_sync_stale_minutes', '15', 'HR同步游标超过该时间未更新视为已中断（分钟）'),
+                ('hr_sync_watermark_mode', 'true', '增量同步是否使用已入库数据的最大更新时间作为水位'),
+                ('hr_sync_watermark_overlap_seconds', '300', '水位增量同步的重叠窗口（秒）'),
                 ('valid_employee_statuses', '["1"]', '有效的员工状态列表（JSON格式）'),
             ],
 
+            # 出站HTTP连接配置
+            'http_config': [
+                ('http_pool_connections', '4', '每个主机缓存的连接池数量'),
+                ('http_pool_maxsize', '10', '每个连接池保持的最大连接数'),
+                ('http_connect_timeout', '5', '建立连接超时时间（秒）'),
+                ('http_read_timeout', '30', '默认读取超时时间（秒）'),
+                ('http_max_retries', '2', '传输层最大重试次数'),
+                ('http_retry_backoff', '0.5', '传输层重试退避基数（秒，带随机抖动）'),
+            ],
+
+            # 外部服务熔断配置
+            'breaker_config': [
+                ('circuit_breaker_failure_threshold', '5', '外部服务连续失败多少次后熔断'),
+                ('circuit_breaker_cooldown_seconds', '60', '熔断后多久发起探测调用（秒）'),
+            ],
+
+            # 外部服务 token 配置
+            'token_config': [
+                ('token_refresh_margin_seconds', '300', 'token 距过期不足该时间（秒）时提前刷新'),
+                ('token_refresh_lock_seconds', '30', 'token 刷新锁时长（秒），持有锁的进程退出后超过该时间由其他进程刷新'),
+                ('token_local_cache_seconds', '30', 'token 进程内缓存时间（秒），超过后重新读库，后台作废的 token 在该时间内生效'),
+                ('hieds_token_ttl_seconds', '3600', 'HIEDS token 响应未返回有效期时使用的有效期（秒）'),
+            ],
+
             # 任务处理配置
             'task_config': [
                 ('account_creation_max_retries', '5', '账号创建最大重试次数'),
+                ('account_creation_retry_base_seconds', '60', '账号创建失败重试的退避基数（秒），每次失败翻倍'),
+                ('account_creation_retry_max_seconds', '3600', '账号创建失败重试的最大退避时间（秒）'),
+                ('task_planning_full_interval_minutes', '1440', '全量任务规划间隔（分钟），其余运行只评估待规划的员工'),
+                ('account_processing_workers', '1', '账号任务并发执行线程数'),
+                ('account_task_lease_seconds', '300', '账号任务认领租约时长（秒），执行进程退出后超过该时间任务被放回队列'),
+                ('idaas_max_concurrency', '4', 'IDAAS开户接口最大并发调用数'),
+                ('welink_max_concurrency', '4', 'Welink开户接口最大并发调用数'),
+                ('email_max_concurrency', '2', '邮箱开通接口最大并发调用数'),
+                ('mapping_snapshot_check_seconds', '5', '部门映射和人员类型映射快照比对版本号的间隔（秒）'),
             ],
 
             # IDAAS配置
@@ -72,6 +120,8 @@ class Command(BaseCommand):
             'email_config': [
                 ('default_email_domain', '@qq.com', '默认邮箱域名（当person_type无映射时使用）'),
                 ('email_auth_token', 'abcdefghijklmnopqrstuvwsyz', '邮箱认证令牌'),
+                ('email_batch_size', '1', '每次邮箱开通请求合并的邮箱数量，为1时逐个开通'),
+                ('email_unknown_result_max_defers', '3', '批量开通响应中缺少结果的邮箱任务最多推迟确认的次数，超过后按失败计入重试次数'),
             ]
         }
 
@@ -86,6 +136,18 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(f'\n同步配置初始化完成，共初始化 {total_configs} 个配置项'))
 
+    def _backfill_task_attempt_counts(self):
+        """按已有执行日志数回填旧任务的 attempt_count"""
+        self.stdout.write('\n开始回填任务尝试次数...')
+        updated = AccountCreationTask.backfill_attempt_counts()
+        self.stdout.write(self.style.SUCCESS(f'任务尝试次数回填完成，共更新 {updated} 个任务'))
+
+    def _seed_email_allocations(self):
+        """将分配表上线前已开通的邮箱地址写入分配表，避免再次分配给其他人员"""
+        self.stdout.write('\n开始回填邮箱分配记录...')
+        seeded = EmailAllocation.seed_issued()
+        self.stdout.write(self.style.SUCCESS(f'邮箱分配记录回填完成，共回填 {seeded} 个地址'))
+
     def _init_person_type_mappings(self):
         """初始化人员类型映射数据"""
         self.stdout.write('\n开始初始化人员类型映射数据...')
@@ -0,0 +1,133 @@
+import logging
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Min
+from django.utils import timezone
+
+from syncservice.models import AccountCreationTask
+from syncservice.processor import AccountTaskProcessor
+from syncservice.services import ConfigService
+from syncservice.transport import format_stats
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '常驻运行账号开通工作进程，持续处理账号创建任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='并发执行任务的线程数，默认读取配置 account_processing_workers',
+        )
+        parser.add_argument(
+            '--max-tasks',
+            type=int,
+            default=50,
+            help='每轮最多处理的任务数量',
+        )
+        parser.add_argument(
+            '--min-sleep',
+            type=float,
+            default=1,
+            help='有任务时两轮之间的最短等待时间（秒）',
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=float,
+            default=30,
+            help='空闲时两轮之间的最长等待时间（秒）',
+        )
+        parser.add_argument(
+            '--max-cycles',
+            type=int,
+            default=0,
+            help='运行指定轮数后退出，0 表示一直运行',
+        )
+
+    def handle(self, *args, **options):
+        self._stop = threading.Event()
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+        min_sleep = max(options['min_sleep'], 0.1)
+        max_sleep = max(options['max_sleep'], min_sleep)
+        max_tasks = options['max_tasks']
+
+        # 执行器在整个进程生命周期内复用，保留 token 缓存和连接池
+        processor = AccountTaskProcessor.from_config(workers=options['workers'], output=self.stdout.write)
+        self.stdout.write(f'账号开通工作进程已启动: {processor.worker_id}，并发线程数 {processor.workers}')
+
+        sleep_seconds = min_sleep
+        cycles = 0
+        while not self._stop.is_set():
+            # 长时间运行时数据库连接可能已失效
+            close_old_connections()
+
+            try:
+                processed = self._run_cycle(processor, max_tasks)
+            except Exception as e:
+                logger.error(f'账号开通工作进程本轮执行失败: {e}')
+                processed = 0
+
+            cycles += 1
+            if options['max_cycles'] and cycles >= options['max_cycles']:
+                break
+
+            # 有任务时尽快进入下一轮，空闲时逐步拉长等待，但不晚于下一个重试任务到期
+            sleep_seconds = min_sleep if processed else min(sleep_seconds * 2, max_sleep)
+            self._stop.wait(self._get_sleep_seconds(sleep_seconds, min_sleep))
+
+        close_old_connections()
+        self.stdout.write(f'连接复用统计: {format_stats(processor.service.transport.stats())}')
+        self.stdout.write('账号开通工作进程已停止')
+
+    def _run_cycle(self, processor, max_tasks):
+        """执行一轮处理，返回本轮执行的任务数"""
+        if not ConfigService.get_bool_config('task_processing_enabled', True):
+            return 0
+
+        # 回收失败不影响本轮处理
+        try:
+            reaped = AccountCreationTask.reap_expired_leases()
+        except Exception as e:
+            logger.error(f'回收租约过期任务失败: {e}')
+            reaped = 0
+        if reaped:
+            self.stdout.write(self.style.WARNING(f'回收租约过期任务 {reaped} 个'))
+
+        tasks = AccountTaskProcessor.fetch_due_tasks(max_tasks)
+        if not tasks:
+            return 0
+
+        stats = processor.process(tasks)
+        self.stdout.write(
+            f'本轮处理完成: 总计 {stats["processed"]} 个任务，成功 {stats["success"]} 个，'
+            f'失败 {stats["failed"]} 个，推迟 {stats["deferred"]} 个'
+        )
+        return stats['processed']
+
+    def _get_sleep_seconds(self, sleep_seconds, min_sleep):
+        """等待时间不超过最近一个重试任务的到期时间，查询失败时按原等待时间"""
+        now = timezone.now()
+        try:
+            next_attempt_at = AccountCreationTask.objects.filter(
+                status__in=AccountCreationTask.CLAIMABLE_STATUSES, next_attempt_at__gt=now
+            ).aggregate(next_attempt_at=Min('next_attempt_at'))['next_attempt_at']
+        except Exception as e:
+            logger.error(f'查询下一个重试任务时间失败: {e}')
+            return sleep_seconds
+
+        if next_attempt_at:
+            sleep_seconds = min(sleep_seconds, max((next_attempt_at - now).total_seconds(), min_sleep))
+        return sleep_seconds
+
+    def _handle_signal(self, signum, frame):
+        """收到 SIGTERM/SIGINT 后处理完当前这一轮再退出"""
+        self.stdout.write(f'收到信号 {signum}，当前一轮处理完成后退出')
+        self._stop.set()
@@ -1,15 +1,32 @@
 import os
+import hashlib
 import requests
 import json
+import uuid
 from datetime import datetime, timedelta
+from functools import partial
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
-import time
 
-from syncservice.models import HrPerson, HrPersonAccount, SyncConfig, AccountCreationRequest, AccountCreationRequestItem
+from syncservice.fetcher import PageFetcher, TokenBucket
+from syncservice.identity import compute_identity_fields
+from syncservice.models import HrPerson, HrPersonAccount, HrSyncRun, SyncConfig, AccountCreationRequest, AccountCreationRequestItem
 from syncservice.services import ConfigService
-
+from syncservice.tokens import get_token_store
+from syncservice.transport import format_stats, get_transport
+
+# 同步时需要写入的人员字段（主键除外）
+PERSON_UPDATE_FIELDS = [
+    'employee_number', 'full_name', 'english_name', 'sex', 'birth_day', 'nationality_code',
+    'person_type', 'employee_status', 'employee_account', 'user_id', 'employee_description',
+    'email_address', 'telephone_number1', 'telephone_number2', 'telephone_number3',
+    'full_address', 'postal_code', 'base_location', 'expense_account', 'person_pinyin_name',
+    'original_hire_date', 'creation_date', 'last_update_date', 'effective_date', 'disable_date',
+    'person_dept', 'tenant_id', 'created_by', 'last_updated_by', 'content_hash',
+    'name_pinyin', 'account_username', 'mail_alias',
+]
 
 class Command(BaseCommand):
     help = '同步人员数据从HIEDS API'
@@ -26,10 +43,17 @@ class Command(BaseCommand):
             default=20,
             help='每页大小，默认20',
         )
+        parser.add_argument(
+            '--no-resume',
+            action='store_true',
+            help='不续传未完成的同步，从第一页重新开始',
+        )
 
     def handle(self, *args, **options):
         force_full_sync = options['force_full_sync']
         page_size = options['page_size']
+        resume = not options['no_resume']
+        sync_run = None
 
         self.stdout.write('开始同步人员数据...')
 
@@ -51,71 +75,154 @@ class Command(BaseCommand):
             if not all([account, secret, project, enterprise, tenant_id]):
                 raise CommandError('缺少必要的环境变量配置')
 
-            # 获取token
+            # 获取token（分页请求鉴权失败时由 token 存储换新 token 重试）
             self.stdout.write('获取访问token...')
-            token = self._get_token(account, secret, project, enterprise)
-            if not token:
+            token_name = f'hieds_token:{account}:{project}:{enterprise}'
+            fetch_token = partial(self._request_token, account, secret, project, enterprise)
+            if not self._get_token(token_name, fetch_token):
                 raise CommandError('获取token失败')
 
             # 获取上次同步时间
             last_sync_time = None
             if not force_full_sync:
-                last_sync_time_str = SyncConfig.get_config('last_sync_time')
-                if last_sync_time_str:
-                    last_sync_time = datetime.fromisoformat(last_sync_time_str.replace('Z', '+00:00'))
-                    self.stdout.write(f'增量同步，上次同步时间: {last_sync_time}')
-
-            # 分页获取人员数据
-            total_synced = 0
-            cur_page = 1
-
-            while True:
-                self.stdout.write(f'获取第{cur_page}页数据...')
-
-                data = self._fetch_persons_page(token, project, tenant_id, page_size, cur_page, last_sync_time)
-
-                if not data or 'result' not in data:
-                    self.stdout.write(self.style.WARNING(f'第{cur_page}页无数据'))
-                    break
-
-                persons = data['result']
-                if not persons:
-                    break
-
-                # 保存人员数据
-                synced_count = self._save_persons(persons)
-                total_synced += synced_count
-
-                # 检查是否还有更多数据
-                page_info = data.get('pageInfo', {})
-                total_pages = page_info.get('totalPages', 0)
+                last_sync_time = self._get_incremental_start_time()
+
+            # 获取或续传同步运行记录
+            mode = 'full' if force_full_sync else 'incremental'
+            sync_run = self._get_sync_run(mode, page_size, last_sync_time, resume)
+            if sync_run is None:
+                self.stdout.write(self.style.WARNING('已有HR同步正在运行，跳过本次同步'))
+                return
+
+            last_sync_time = sync_run.start_watermark
+            start_page = sync_run.last_committed_page + 1
+            if start_page > 1:
+                self.stdout.write(f'续传同步 {sync_run.run_id}，从第{start_page}页开始（共{sync_run.total_pages}页）')
+
+            # 并发分页获取人员数据，按页码顺序写库
+            fetcher = PageFetcher(
+                lambda cur_page: self._fetch_persons_page(token_name, fetch_token, project, tenant_id, page_size, cur_page, last_sync_time),
+                workers=ConfigService.get_int_config('hieds_fetch_workers', 4),
+                rate_limiter=TokenBucket.from_config('hieds'),
+                max_retries=ConfigService.get_int_config('hieds_page_max_retries', 3),
+            )
 
-                if cur_page >= total_pages:
-                    break
+            for cur_page, data in fetcher.fetch_all(start_page):
+                persons = data.get('result')
+                total_pages = data.get('pageInfo', {}).get('totalPages', 0) or 0
 
-                cur_page += 1
+                # 页面数据和游标在同一事务中提交，中断后从下一页续传
+                with transaction.atomic():
+                    if persons:
+                        self.stdout.write(f'保存第{cur_page}页数据...')
+                        page_stats, page_watermark = self._save_persons(persons)
+                    else:
+                        self.stdout.write(self.style.WARNING(f'第{cur_page}页无数据'))
+                        page_stats, page_watermark = {}, None
+                    sync_run.commit_page(cur_page, total_pages, page_stats, page_watermark)
 
-                # 添加延迟避免API限流
-                time.sleep(1)
+            sync_run.finish('success')
 
-            # 更新同步状态
-            SyncConfig.set_config('last_sync_time', timezone.now().isoformat(), '上次同步时间')
+            # 更新同步状态（使用本次同步的开始时间，避免遗漏同步期间更新的记录）
+            SyncConfig.set_config('last_sync_time', sync_run.started_at.isoformat(), '上次同步时间')
+            self._advance_watermark(sync_run.max_watermark)
             SyncConfig.set_config('last_sync_status', 'success', '上次同步状态')
             SyncConfig.set_config('total_persons', str(HrPerson.objects.count()), '总人员数')
 
             self.stdout.write(
-                self.style.SUCCESS(f'同步完成，共同步 {total_synced} 条记录，当前总人数: {HrPerson.objects.count()}')
+                self.style.SUCCESS(
+                    f'同步完成，新增 {sync_run.inserted_count} 条，更新 {sync_run.updated_count} 条，'
+                    f'未变化 {sync_run.unchanged_count} 条，失败 {sync_run.failed_count} 条，当前总人数: {HrPerson.objects.count()}'
+                )
             )
+            self.stdout.write(f'连接复用统计: {format_stats(get_transport().stats())}')
 
         except Exception as e:
-            # 记录失败状态
+            # 记录失败状态，已提交的页码保留在运行记录中供下次续传
+            if sync_run is not None and sync_run.status == 'running':
+                sync_run.finish('failed', str(e))
             SyncConfig.set_config('last_sync_status', f'failed: {str(e)}', '上次同步状态')
             raise CommandError(f'同步失败: {str(e)}')
 
+    def _get_incremental_start_time(self):
+        """计算增量同步的起始时间
+
+        水位模式下使用已入库数据的最大 last_update_date 减去重叠窗口，
+        重叠窗口内重复返回的记录由内容摘要判定为未变化，不会产生写入。
+        """
+        if ConfigService.get_bool_config('hr_sync_watermark_mode', True):
+            watermark_str = SyncConfig.get_config('last_sync_watermark')
+            if watermark_str:
+                watermark = datetime.fromisoformat(watermark_str)
+                overlap_seconds = ConfigService.get_int_config('hr_sync_watermark_overlap_seconds', 300)
+                start_time = watermark - timedelta(seconds=overlap_seconds)
+                self.stdout.write(f'增量同步，数据水位: {watermark}，重叠窗口 {overlap_seconds} 秒')
+                return start_time
+
+        last_sync_time_str = SyncConfig.get_config('last_sync_time')
+        if last_sync_time_str:
+            last_sync_time = datetime.fromisoformat(last_sync_time_str.replace('Z', '+00:00'))
+            self.stdout.write(f'增量同步，上次同步时间: {last_sync_time}')
+            return last_sync_time
+
+        return None
+
+    def _get_max_last_update_date(self, values):
+        """获取一组 lastUpdateDate 中的最大值（缺失或无法解析的不计入）"""
+        max_value = None
+        for value in values:
+            if value is None:
+                continue
+            if max_value is None or value > max_value:
+                max_value = value
+        return max_value
+
+    def _advance_watermark(self, max_watermark):
+        """同步成功后推进数据水位，水位只增不减"""
+        if max_watermark is None:
+            return
+
+        watermark_str = SyncConfig.get_config('last_sync_watermark')
+        if watermark_str and datetime.fromisoformat(watermark_str) >= max_watermark:
+            return
+
+        SyncConfig.set_config('last_sync_watermark', max_watermark.isoformat(), '已同步数据的最大更新时间')
+
+    def _get_sync_run(self, mode, page_size, last_sync_time, resume=True):
+        """获取可续传的同步运行记录，没有则新建；已有同步正在运行时返回 None"""
+        unfinished_runs = HrSyncRun.objects.filter(mode=mode, status__in=['running', 'failed'])
+
+        # 仍在更新游标的运行记录说明另一个同步进程正在执行
+        stale_minutes = ConfigService.get_int_config('hr_sync_stale_minutes', 15)
+        stale_before = timezone.now() - timedelta(minutes=stale_minutes)
+        if unfinished_runs.filter(status='running', updated_at__gte=stale_before).exists():
+            return None
+
+        if resume:
+            resume_hours = ConfigService.get_int_config('hr_sync_resume_max_age_hours', 24)
+            sync_run = unfinished_runs.filter(
+                page_size=page_size,
+                started_at__gte=timezone.now() - timedelta(hours=resume_hours),
+            ).order_by('-started_at').first()
+
+            if sync_run:
+                unfinished_runs.exclude(pk=sync_run.pk).update(status='abandoned', finished_at=timezone.now())
+                sync_run.status = 'running'
+                sync_run.error_message = None
+                sync_run.save(update_fields=['status', 'error_message', 'updated_at'])
+                return sync_run
+
+        unfinished_runs.update(status='abandoned', finished_at=timezone.now())
+
+        return HrSyncRun.objects.create(
+            run_id=f"sync_{timezone.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}",
+            mode=mode,
+            page_size=page_size,
+            start_watermark=last_sync_time,
+        )
+
     def _process_account_creation_requests(self):
         """处理账号创建请求缓冲区"""
-        import hashlib
-
         # 获取所有 pending 状态的请求
         pending_requests = AccountCreationRequest.objects.filter(status='pending')
 
@@ -135,6 +242,7 @@ class Command(BaseCommand):
             items = request.items.filter(status='pending')
             synced_count = 0
             failed_count = 0
+            created_persons = []
 
             for item in items:
                 try:
@@ -163,7 +271,12 @@ class Command(BaseCommand):
                                 'department_code': item.department_code,
                                 'partner_company': item.partner_company or '',
                                 'country': item.country
-                            }]
+                            }],
+                            # 数据来自请求而非HR，清空摘要以便下次HR同步时重新写入
+                            'content_hash': None,
+                            # 请求中的人员需要规划账号任务
+                            'planning_dirty_at': timezone.now(),
+                            **compute_identity_fields(item.employee_number, item.employee_name),
                         }
                     )
 
@@ -172,11 +285,10 @@ class Command(BaseCommand):
                     item.status = 'synced'
                     item.save()
 
-                    # 如果是新创建的人员，创建默认账号记录
+                    # 新创建的人员稍后统一创建默认账号记录
                     if created:
-                        accounts_created = HrPersonAccount.create_default_accounts(person)
+                        created_persons.append(person)
                         self.stdout.write(f'  新增人员: {person.employee_number} - {person.full_name}')
-                        self.stdout.write(f'    创建账号记录: {len(accounts_created)} 个')
                     else:
                         self.stdout.write(f'  更新人员: {person.employee_number} - {person.full_name}')
 
@@ -189,14 +301,30 @@ class Command(BaseCommand):
                     item.save()
                     failed_count += 1
 
+            # 为本请求新增的人员批量创建默认账号记录
+            if created_persons:
+                accounts_created = HrPersonAccount.bulk_create_default_accounts(created_persons)
+                self.stdout.write(f'  创建账号记录: {len(accounts_created)} 个')
+
             # 更新请求的已处理用户数
             request.processed_users = synced_count + failed_count
             request.save()
 
             self.stdout.write(f'请求 {request.request_id} 处理完成: 成功 {synced_count}, 失败 {failed_count}')
 
-    def _get_token(self, account, secret, project, enterprise):
-        """获取访问token"""
+    def _get_token(self, token_name, fetch_token):
+        """获取访问token，多个进程共享同一个 token，临近过期时由一个进程刷新"""
+        try:
+            return get_token_store().get(token_name, fetch_token)
+        except requests.RequestException as e:
+            self.stdout.write(self.style.ERROR(f'获取token失败: {e}'))
+            return None
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return None
+
+    def _request_token(self, account, secret, project, enterprise):
+        """请求新的访问token，返回 (token, 有效期秒数)"""
         url = 'https://apig.hieds.net/api/iam/auth/token'
         headers = {'Content-Type': 'application/json'}
 
@@ -213,28 +341,19 @@ class Command(BaseCommand):
             }
         }
 
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
+        response = get_transport().post(url, headers=headers, json=data, idempotent=True)
+        response.raise_for_status()
 
-            result = response.json()
-            if result.get('code') == '201' and 'access_token' in result:
-                return result['access_token']
-            else:
-                self.stdout.write(self.style.ERROR(f'Token响应: {result}'))
-                return None
+        result = response.json()
+        if result.get('code') != '201' or 'access_token' not in result:
+            raise Exception(f'Token响应: {result}')
 
-        except requests.RequestException as e:
-            self.stdout.write(self.style.ERROR(f'获取token失败: {e}'))
-            return None
+        return result['access_token'], int(result.get('expires_in') or ConfigService.get_int_config('hieds_token_ttl_seconds', 3600))
 
-    def _fetch_persons_page(self, token, project_id, tenant_id, page_size, cur_page, last_sync_time=None):
-        """获取一页人员数据"""
+    def _fetch_persons_page(self, token_name, fetch_token, project_id, tenant_id, page_size, cur_page,
+                            last_sync_time=None):
+        """获取一页人员数据，token 失效（401/403）时作废并换新 token 重试一次"""
         url = f'https://apig.hieds.net/api/meta/api/engine/idata/projects/{project_id}/catalog/hr_person_info'
-        headers = {
-            'Authorization': token,
-            'Content-Type': 'application/json'
-        }
 
         data = {
             "tenant_id": tenant_id,
@@ -244,10 +363,20 @@ class Command(BaseCommand):
 
         # 如果有增量同步时间，添加到查询参数
         if last_sync_time:
+            # HR 时间按本地时区解析，查询条件同样使用本地时间
+            if timezone.is_aware(last_sync_time):
+                last_sync_time = timezone.localtime(last_sync_time)
             data["startTime"] = last_sync_time.strftime('%Y-%m-%d %H:%M:%S')
 
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=60)
+            response = get_token_store().call(
+                token_name,
+                fetch_token,
+                lambda token: get_transport().post(
+                    url, headers={'Authorization': token, 'Content-Type': 'application/json'},
+                    json=data, idempotent=True,
+                ),
+            )
             response.raise_for_status()
 
             result = response.json()
@@ -262,67 +391,166 @@ class Command(BaseCommand):
             return None
 
     def _save_persons(self, persons):
-        """保存人员数据"""
-        synced_count = 0
-
+        """批量保存一页人员数据
+
+        先比较内容摘要，摘要未变化的记录直接跳过；其余记录一次查询区分新增和变更，
+        在同一个事务里 bulk_create 新增、bulk_update 变更。
+        批量写入失败时退回到逐条保存，每条记录使用独立保存点隔离错误。
+        返回 (inserted/updated/unchanged/failed 统计, 成功入库记录的最大 lastUpdateDate)，
+        解析或保存失败的记录不计入水位，避免水位越过未入库的记录。
+        """
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+
+        # 准备数据映射（同一页重复的 personId 以最后一条为准）
+        person_dicts = {}
+        last_update_dates = {}
         for person_data in persons:
             try:
-                person_id = person_data['personId']
-
-                # 准备数据映射
-                person_dict = {
-                    'person_id': person_id,
-                    'employee_number': person_data.get('employeeNumber', ''),
-                    'full_name': person_data.get('fullName', ''),
-                    'english_name': person_data.get('englishName'),
-                    'sex': person_data.get('sex'),
-                    'birth_day': self._parse_date(person_data.get('birthDay')),
-                    'nationality_code': person_data.get('nationalityCode'),
-                    'person_type': person_data.get('personType', ''),
-                    'employee_status': person_data.get('employeeStatus', ''),
-                    'employee_account': person_data.get('employeeAccount'),
-                    'user_id': person_data.get('userId'),
-                    'employee_description': person_data.get('employeeDescription'),
-                    'email_address': person_data.get('emailAddress'),
-                    'telephone_number1': person_data.get('telephoneNumber1'),
-                    'telephone_number2': person_data.get('telephoneNumber2'),
-                    'telephone_number3': person_data.get('telephoneNumber3'),
-                    'full_address': person_data.get('fullAddress'),
-                    'postal_code': person_data.get('postalCode'),
-                    'base_location': person_data.get('baseLocation'),
-                    'expense_account': person_data.get('expenseAccount'),
-                    'person_pinyin_name': person_data.get('personPinyinName'),
-                    'original_hire_date': self._parse_date(person_data.get('originalHireDate')),
-                    'creation_date': self._parse_datetime(person_data.get('creationDate')),
-                    'last_update_date': self._parse_datetime(person_data.get('lastUpdateDate')),
-                    'effective_date': self._parse_date(person_data.get('effectiveDate')),
-                    'disable_date': self._parse_date(person_data.get('disableDate')),
-                    'person_dept': person_data.get('personDept', []),
-                    'tenant_id': person_data.get('tenantId', ''),
-                    'created_by': person_data.get('createdBy', ''),
-                    'last_updated_by': person_data.get('lastUpdatedBy', ''),
-                }
+                person_dict = self._build_person_dict(person_data)
+                person_dict['content_hash'] = self._compute_content_hash(person_dict, person_data)
+                person_dicts[person_dict['person_id']] = person_dict
+                last_update_dates[person_dict['person_id']] = self._parse_datetime_strict(person_data.get('lastUpdateDate'))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'解析人员数据失败: {person_data.get("personId", "unknown")}, 错误: {e}'))
+                stats['failed'] += 1
+
+        if not person_dicts:
+            return stats, None
+
+        # 只取主键、摘要和员工状态，不加载整行
+        existing = {
+            person_id: (content_hash, employee_status)
+            for person_id, content_hash, employee_status in HrPerson.objects.filter(
+                person_id__in=list(person_dicts.keys())
+            ).values_list('person_id', 'content_hash', 'employee_status')
+        }
 
-                # 使用update_or_create根据person_id更新或创建记录
-                person, created = HrPerson.objects.update_or_create(
-                    person_id=person_id,
-                    defaults=person_dict
-                )
+        to_create = []
+        to_update = []
+        unchanged_person_ids = []
+        # 新增人员和员工状态变化的人员需要重新规划账号任务
+        dirty_person_ids = []
+        for person_id, person_dict in person_dicts.items():
+            if person_id not in existing:
+                to_create.append(self._build_person(person_dict))
+                dirty_person_ids.append(person_id)
+                continue
 
-                synced_count += 1
-                if created:
-                    self.stdout.write(f'新增人员: {person.employee_number} - {person.full_name}')
-                    # 为新人员创建默认账号记录
-                    accounts_created = HrPersonAccount.create_default_accounts(person)
-                    self.stdout.write(f'  创建账号记录: {len(accounts_created)} 个')
-                else:
-                    self.stdout.write(f'更新人员: {person.employee_number} - {person.full_name}')
+            content_hash, employee_status = existing[person_id]
+            if content_hash != person_dict['content_hash']:
+                to_update.append(self._build_person(person_dict))
+                if employee_status != person_dict['employee_status']:
+                    dirty_person_ids.append(person_id)
+            else:
+                unchanged_person_ids.append(person_id)
+                stats['unchanged'] += 1
 
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'保存人员数据失败: {person_data.get("personId", "unknown")}, 错误: {e}'))
-                continue
+        try:
+            with transaction.atomic():
+                HrPerson.objects.bulk_create(to_create)
+                HrPerson.objects.bulk_update(to_update, PERSON_UPDATE_FIELDS)
+            created_persons = to_create
+            updated_persons = to_update
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'批量保存失败，改为逐条保存: {e}'))
+            created_persons, updated_persons = self._save_persons_one_by_one(to_create + to_update, stats)
+
+        # 单独标记，避免 bulk_update 覆盖尚未规划的标记
+        HrPerson.mark_planning_dirty(dirty_person_ids)
+
+        stats['inserted'] += len(created_persons)
+        stats['updated'] += len(updated_persons)
+
+        for person in created_persons:
+            self.stdout.write(f'新增人员: {person.employee_number} - {person.full_name}')
+
+        # 为新人员批量创建默认账号记录
+        if created_persons:
+            accounts_created = HrPersonAccount.bulk_create_default_accounts(created_persons)
+            self.stdout.write(f'  创建账号记录: {len(accounts_created)} 个')
+
+        for person in updated_persons:
+            self.stdout.write(f'更新人员: {person.employee_number} - {person.full_name}')
+
+        ingested_person_ids = unchanged_person_ids + [person.person_id for person in created_persons + updated_persons]
+        return stats, self._get_max_last_update_date(last_update_dates[person_id] for person_id in ingested_person_ids)
+
+    def _build_person(self, person_dict):
+        """构建待写入的人员，派生字段不参与摘要，只为新增或变化的记录计算"""
+        return HrPerson(**person_dict, **compute_identity_fields(person_dict['employee_number'], person_dict['full_name']))
 
-        return synced_count
+    def _save_persons_one_by_one(self, persons, stats):
+        """逐条保存人员，每条记录使用保存点，单条失败不影响其他记录"""
+        created_persons = []
+        updated_persons = []
+
+        with transaction.atomic():
+            for person in persons:
+                person_dict = {field: getattr(person, field) for field in PERSON_UPDATE_FIELDS}
+                try:
+                    with transaction.atomic():
+                        person, created = HrPerson.objects.update_or_create(
+                            person_id=person.person_id,
+                            defaults=person_dict
+                        )
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'保存人员数据失败: {person.person_id}, 错误: {e}'))
+                    stats['failed'] += 1
+                    continue
+
+                if created:
+                    created_persons.append(person)
+                else:
+                    updated_persons.append(person)
+
+        return created_persons, updated_persons
+
+    def _compute_content_hash(self, person_dict, person_data):
+        """计算人员数据的稳定摘要"""
+        normalized = dict(person_dict)
+        # 时间字段缺失或无法解析时会回退为当前时间，摘要中按缺失处理以保持稳定
+        if self._parse_datetime_strict(person_data.get('creationDate')) is None:
+            normalized['creation_date'] = None
+        if self._parse_datetime_strict(person_data.get('lastUpdateDate')) is None:
+            normalized['last_update_date'] = None
+
+        payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _build_person_dict(self, person_data):
+        """将接口返回的人员数据映射为模型字段"""
+        return {
+            'person_id': person_data['personId'],
+            'employee_number': person_data.get('employeeNumber', ''),
+            'full_name': person_data.get('fullName', ''),
+            'english_name': person_data.get('englishName'),
+            'sex': person_data.get('sex'),
+            'birth_day': self._parse_date(person_data.get('birthDay')),
+            'nationality_code': person_data.get('nationalityCode'),
+            'person_type': person_data.get('personType', ''),
+            'employee_status': person_data.get('employeeStatus', ''),
+            'employee_account': person_data.get('employeeAccount'),
+            'user_id': person_data.get('userId'),
+            'employee_description': person_data.get('employeeDescription'),
+            'email_address': person_data.get('emailAddress'),
+            'telephone_number1': person_data.get('telephoneNumber1'),
+            'telephone_number2': person_data.get('telephoneNumber2'),
+            'telephone_number3': person_data.get('telephoneNumber3'),
+            'full_address': person_data.get('fullAddress'),
+            'postal_code': person_data.get('postalCode'),
+            'base_location': person_data.get('baseLocation'),
+            'expense_account': person_data.get('expenseAccount'),
+            'person_pinyin_name': person_data.get('personPinyinName'),
+            'original_hire_date': self._parse_date(person_data.get('originalHireDate')),
+            'creation_date': self._parse_datetime(person_data.get('creationDate')),
+            'last_update_date': self._parse_datetime(person_data.get('lastUpdateDate')),
+            'effective_date': self._parse_date(person_data.get('effectiveDate')),
+            'disable_date': self._parse_date(person_data.get('disableDate')),
+            'person_dept': person_data.get('personDept', []),
+            'tenant_id': person_data.get('tenantId', ''),
+            'created_by': person_data.get('createdBy', ''),
+            'last_updated_by': person_data.get('lastUpdatedBy', ''),
+        }
 
     def _parse_date(self, date_str):
         """解析日期字符串"""
@@ -334,14 +562,21 @@ class Command(BaseCommand):
             return None
 
     def _parse_datetime(self, datetime_str):
-        """解析日期时间字符串"""
-        if not datetime_str:
-            return timezone.now()  # 默认当前时间
+        """解析日期时间字符串，缺失或无法解析时使用当前时间"""
+        value = self._parse_datetime_strict(datetime_str)
+        return value if value is not None else timezone.now()
+
+    def _parse_datetime_strict(self, datetime_str):
+        """解析日期时间字符串，缺失或无法解析时返回 None（用于水位计算，不能以当前时间代替）"""
+        if not datetime_str or not isinstance(datetime_str, str):
+            return None
         try:
             # 处理不同的时间格式
             if 'T' in datetime_str:
-                return datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
+                value = datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
             else:
-                return datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
+                value = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
+            # 无时区信息的时间按本地时区处理，与数据库中读出的值保持可比
+            return timezone.make_aware(value) if timezone.is_naive(value) else value
         except ValueError:
-            return timezone.now()
\ No newline at end of file
+            return None
\ No newline at end of file
@@ -1,6 +1,16 @@
-from django.db import models
+import json
+import logging
+import random
+import re
+import uuid
+import zlib
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, models, transaction
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 
 class HrPersonAccount(models.Model):
     """人员账号模型"""
@@ -47,30 +57,46 @@ class HrPersonAccount(models.Model):
     @staticmethod
     def create_default_accounts(person):
         """为人员创建默认的三种账号记录"""
+        return HrPersonAccount.bulk_create_default_accounts([person])
+
+    @staticmethod
+    def bulk_create_default_accounts(persons):
+        """批量为人员创建缺失的默认账号记录
+
+        一次查询取出已有的 (人员, 账号类型)，再一次 bulk_create 补齐缺失的记录。
+        """
         account_types = ['idaas', 'welink', 'email']
-        accounts_created = []
-
-        for account_type in account_types:
-            # 设置账号标识
-            identifier = None
-            if account_type == 'email' and person.email_address:
-                identifier = person.email_address
-            elif account_type in ['idaas', 'welink'] and person.employee_account:
-                identifier = person.employee_account
-
-            account, created = HrPersonAccount.objects.get_or_create(
-                person=person,
-                account_type=account_type,
-                defaults={
-                    'account_identifier': identifier,
-                    'is_created': True  # 默认已创建
-                }
-            )
+        persons = list(persons)
+        if not persons:
+            return []
+
+        existing = set(
+            HrPersonAccount.objects.filter(person__in=persons).values_list('person_id', 'account_type')
+        )
 
-            if created:
-                accounts_created.append(account)
+        accounts_to_create = []
+        for person in persons:
+            for account_type in account_types:
+                if (person.pk, account_type) in existing:
+                    continue
 
-        return accounts_created
+                # 设置账号标识
+                identifier = None
+                if account_type == 'email' and person.email_address:
+                    identifier = person.email_address
+                elif account_type in ['idaas', 'welink'] and person.employee_account:
+                    identifier = person.employee_account
+
+                accounts_to_create.append(HrPersonAccount(
+                    person=person,
+                    account_type=account_type,
+                    account_identifier=identifier,
+                    is_created=True  # 默认已创建
+                ))
+
+        # 并发创建时由唯一约束兜底
+        HrPersonAccount.objects.bulk_create(accounts_to_create, ignore_conflicts=True)
+        return accounts_to_create
 
 
 class HrPerson(models.Model):
@@ -107,6 +133,10 @@ class HrPerson(models.Model):
 
     # 拼音和别名
     person_pinyin_name = models.CharField(max_length=100, blank=True, null=True, verbose_name='人员拼音名')
+    # 入库时根据全名预先计算，开户时直接使用
+    name_pinyin = models.CharField(max_length=200, blank=True, null=True, verbose_name='全名拼音')
+    account_username = models.CharField(max_length=100, blank=True, null=True, verbose_name='账号用户名')
+    mail_alias = models.CharField(max_length=200, blank=True, null=True, verbose_name='邮箱别名')
 
     # 日期信息
     original_hire_date = models.DateField(blank=True, null=True, verbose_name='原始入职日期')
@@ -125,6 +155,12 @@ class HrPerson(models.Model):
     created_by = models.CharField(max_length=20, verbose_name='创建人')
     last_updated_by = models.CharField(max_length=20, verbose_name='最后更新人')
 
+    # 同步数据摘要，用于跳过未变化的记录
+    content_hash = models.CharField(max_length=64, blank=True, null=True, verbose_name='内容摘要')
+
+    # 新增或员工状态变化时标记，任务规划只评估被标记的人员
+    planning_dirty_at = models.DateTimeField(blank=True, null=True, verbose_name='待规划时间')
+
     class Meta:
         ordering = ['-creation_date']
         verbose_name = '人员信息'
@@ -136,11 +172,185 @@ class HrPerson(models.Model):
             models.Index(fields=['full_name']),  # 用于搜索优化
             models.Index(fields=['english_name']),  # 用于搜索优化
             models.Index(fields=['email_address']),  # 用于搜索优化
+            models.Index(fields=['planning_dirty_at']),  # 用于增量任务规划
         ]
 
     def __str__(self):
         return f"{self.employee_number} - {self.full_name}"
 
+    @classmethod
+    def mark_planning_dirty(cls, person_ids):
+        """标记人员待重新规划账号任务"""
+        person_ids = list(person_ids)
+        if not person_ids:
+            return 0
+        return cls.objects.filter(person_id__in=person_ids).update(planning_dirty_at=timezone.now())
+
+
+class EmailAllocation(models.Model):
+    """邮箱地址分配表 - 保证邮箱地址唯一，同一人员的各类账号使用同一个地址
+
+    同一拼音别名在同一域名下依次分配 zhangsan、zhangsan2、zhangsan3……
+    人员表中已被其他人使用的地址以无人员的预留记录占位，该人员分配时认领这条预留记录。
+    """
+    person = models.ForeignKey(HrPerson, on_delete=models.CASCADE, blank=True, null=True,
+                               related_name='email_allocations', verbose_name='人员')
+    base_localpart = models.CharField(max_length=200, verbose_name='拼音别名')
+    suffix = models.PositiveIntegerField(default=1, verbose_name='序号')
+    localpart = models.CharField(max_length=200, verbose_name='邮箱前缀')
+    domain = models.CharField(max_length=100, verbose_name='域名')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='分配时间')
+
+    class Meta:
+        verbose_name = '邮箱分配'
+        verbose_name_plural = '邮箱分配'
+        unique_together = [('localpart', 'domain'), ('person', 'domain')]
+        ordering = ['domain', 'localpart']
+        indexes = [
+            models.Index(fields=['base_localpart', 'domain', 'suffix']),  # 用于取下一个序号
+        ]
+
+    def __str__(self):
+        return self.email
+
+    @property
+    def email(self):
+        return f"{self.localpart}@{self.domain}"
+
+    # 单次分配最多尝试的序号个数
+    MAX_ALLOCATE_ATTEMPTS = 100
+
+    @classmethod
+    def allocate(cls, person, base_localpart, domain):
+        """为人员分配邮箱地址，已分配过时直接返回原地址
+
+        起始序号从 (base_localpart, domain, suffix) 索引取最大值加一，
+        地址已被占用（并发分配，或其他别名的序号地址如 li + 2 与 li2 重名）时在本地递增序号，
+        尝试 MAX_ALLOCATE_ATTEMPTS 个序号仍未分配成功时抛出 ValueError。
+        人员自己的 HR 邮箱在该域名下时优先分配该地址（包括认领其他人员分配时留下的预留记录）。
+        """
+        domain = domain.lstrip('@').lower()
+        allocation = cls.objects.filter(person=person, domain=domain).first()
+        if allocation:
+            return allocation
+
+        allocation = cls._allocate_own_address(person, domain)
+        if allocation:
+            return allocation
+
+        max_suffix = cls.objects.filter(base_localpart=base_localpart, domain=domain).aggregate(
+            max_suffix=models.Max('suffix')
+        )['max_suffix'] or 0
+        suffix = max_suffix + 1
+
+        for _ in range(cls.MAX_ALLOCATE_ATTEMPTS):
+            localpart = base_localpart if suffix == 1 else f"{base_localpart}{suffix}"
+
+            # 地址已被其他人员使用（如 HR 系统下发的邮箱）时预留该地址，继续取下一个序号
+            taken = HrPerson.objects.filter(email_address=f"{localpart}@{domain}").exclude(pk=person.pk).exists()
+
+            try:
+                with transaction.atomic():
+                    allocation = cls.objects.create(
+                        person=None if taken else person,
+                        base_localpart=base_localpart,
+                        suffix=suffix,
+                        localpart=localpart,
+                        domain=domain,
+                    )
+            except IntegrityError:
+                # 同一人员已被并发分配时返回该地址，否则是地址冲突，尝试下一个序号
+                allocation = cls.objects.filter(person=person, domain=domain).first()
+                if allocation:
+                    return allocation
+                suffix += 1
+                continue
+
+            if not taken:
+                return allocation
+            suffix += 1
+
+        raise ValueError(
+            f"邮箱地址分配失败: {base_localpart}@{domain} 连续 {cls.MAX_ALLOCATE_ATTEMPTS} 个序号均已被占用"
+        )
+
+    @classmethod
+    def _allocate_own_address(cls, person, domain):
+        """人员的 HR 邮箱在该域名下且未分配给其他人员时，将该地址分配给本人，否则返回 None"""
+        localpart, _, own_domain = (person.email_address or '').strip().lower().partition('@')
+        if not localpart or own_domain != domain:
+            return None
+
+        base_localpart, suffix = cls._split_localpart(localpart)
+        try:
+            with transaction.atomic():
+                claimed = cls.objects.filter(localpart=localpart, domain=domain, person__isnull=True).update(person=person)
+                if not claimed:
+                    cls.objects.create(person=person, base_localpart=base_localpart, suffix=suffix,
+                                       localpart=localpart, domain=domain)
+        except IntegrityError:
+            # 地址已分配给其他人员，或本人已被并发分配
+            return cls.objects.filter(person=person, domain=domain).first()
+        return cls.objects.get(person=person, domain=domain)
+
+    @staticmethod
+    def _split_localpart(localpart):
+        """将邮箱前缀拆成 (拼音别名, 序号)，如 zhangsan2 -> (zhangsan, 2)，无序号时序号为 1"""
+        match = re.match(r'^(.*?)(\d+)$', localpart)
+        if match and match.group(1) and int(match.group(2)) >= 2:
+            return match.group(1), int(match.group(2))
+        return localpart, 1
+
+    @classmethod
+    def seed_issued(cls):
+        """按已开通的邮箱账号和已完成任务结果中的邮箱回填分配记录，返回新增或认领的记录数
+
+        分配表上线前开通的地址不在表中，不回填时分配器可能把同一地址再分给其他人员。
+        """
+        issued = {}
+        for person_id, email in HrPersonAccount.objects.filter(
+            account_type='email', account_identifier__contains='@'
+        ).values_list('person_id', 'account_identifier'):
+            issued.setdefault(email.strip().lower(), person_id)
+        for person_id, result_data in AccountCreationTask.objects.filter(
+            status='completed', result_data__has_key='email'
+        ).values_list('person_id', 'result_data'):
+            email = result_data.get('email') if isinstance(result_data, dict) else None
+            if isinstance(email, str) and '@' in email:
+                issued.setdefault(email.strip().lower(), person_id)
+
+        existing = dict(
+            ((localpart, domain), person_id)
+            for localpart, domain, person_id in cls.objects.values_list('localpart', 'domain', 'person_id')
+        )
+        allocated_persons = {key for key in cls.objects.filter(person__isnull=False).values_list('person_id', 'domain')}
+
+        seeded = 0
+        new_allocations = []
+        for email, person_id in issued.items():
+            localpart, _, domain = email.partition('@')
+            if not localpart or not domain:
+                continue
+            # 同一人员在同一域名下只能有一条分配记录，多出的地址按预留记录占位
+            owner = person_id if (person_id, domain) not in allocated_persons else None
+            if (localpart, domain) in existing:
+                if existing[(localpart, domain)] is None and owner is not None:
+                    seeded += cls.objects.filter(localpart=localpart, domain=domain, person__isnull=True).update(
+                        person_id=owner
+                    )
+                    allocated_persons.add((owner, domain))
+                continue
+
+            base_localpart, suffix = cls._split_localpart(localpart)
+            new_allocations.append(cls(person_id=owner, base_localpart=base_localpart, suffix=suffix,
+                                       localpart=localpart, domain=domain))
+            existing[(localpart, domain)] = owner
+            if owner is not None:
+                allocated_persons.add((owner, domain))
+
+        cls.objects.bulk_create(new_allocations, batch_size=500, ignore_conflicts=True)
+        return seeded + len(new_allocations)
+
 
 class SyncConfig(models.Model):
     """同步配置模型"""
@@ -157,7 +367,7 @@ class SyncConfig(models.Model):
 
     @staticmethod
     def get_config(key, default=None):
-        """获取配置值"""
+        """获取配置值，直接读取数据库，用于同步时间、水位等需要最新值的状态键"""
         try:
             config = SyncConfig.objects.get(key=key)
             return config.value
@@ -179,6 +389,78 @@ class SyncConfig(models.Model):
         return config
 
 
+class HrSyncRun(models.Model):
+    """HR同步运行记录 - 保存分页游标，失败或中断后可从下一页继续"""
+    MODE_CHOICES = [
+        ('full', '全量同步'),
+        ('incremental', '增量同步'),
+    ]
+
+    RUN_STATUS_CHOICES = [
+        ('running', '运行中'),
+        ('success', '成功'),
+        ('failed', '失败'),
+        ('abandoned', '已放弃'),
+    ]
+
+    run_id = models.CharField(max_length=100, unique=True, verbose_name='运行ID')
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, verbose_name='同步模式')
+    status = models.CharField(max_length=20, choices=RUN_STATUS_CHOICES, default='running', verbose_name='运行状态')
+
+    # 分页游标
+    page_size = models.IntegerField(verbose_name='每页大小')
+    start_watermark = models.DateTimeField(blank=True, null=True, verbose_name='起始水位')
+    max_watermark = models.DateTimeField(blank=True, null=True, verbose_name='已入库最大更新时间')
+    total_pages = models.IntegerField(default=0, verbose_name='总页数')
+    last_committed_page = models.IntegerField(default=0, verbose_name='已提交页码')
+
+    # 统计信息
+    inserted_count = models.IntegerField(default=0, verbose_name='新增数')
+    updated_count = models.IntegerField(default=0, verbose_name='更新数')
+    unchanged_count = models.IntegerField(default=0, verbose_name='未变化数')
+    failed_count = models.IntegerField(default=0, verbose_name='失败数')
+
+    error_message = models.TextField(blank=True, null=True, verbose_name='错误信息')
+
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name='开始时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name='结束时间')
+
+    class Meta:
+        verbose_name = 'HR同步记录'
+        verbose_name_plural = 'HR同步记录'
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['mode', 'status']),
+            models.Index(fields=['started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.run_id} - {self.get_status_display()} ({self.last_committed_page}/{self.total_pages})"
+
+    def commit_page(self, page, total_pages, page_stats, max_watermark=None):
+        """记录已提交的页码、统计和最大更新时间，应与该页数据在同一事务中调用"""
+        if max_watermark and (self.max_watermark is None or max_watermark > self.max_watermark):
+            self.max_watermark = max_watermark
+        self.last_committed_page = page
+        self.total_pages = total_pages
+        self.inserted_count += page_stats.get('inserted', 0)
+        self.updated_count += page_stats.get('updated', 0)
+        self.unchanged_count += page_stats.get('unchanged', 0)
+        self.failed_count += page_stats.get('failed', 0)
+        self.save(update_fields=[
+            'last_committed_page', 'total_pages', 'max_watermark', 'inserted_count', 'updated_count',
+            'unchanged_count', 'failed_count', 'updated_at'
+        ])
+
+    def finish(self, status, error_message=None):
+        """结束运行"""
+        self.status = status
+        self.error_message = error_message
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'error_message', 'finished_at', 'updated_at'])
+
+
 class DepartmentMapping(models.Model):
     """部门映射表"""
     idata_departmentcode = models.CharField(max_length=50, unique=True, verbose_name='iData部门代码')
@@ -257,6 +539,20 @@ class AccountCreationTask(models.Model):
         verbose_name='依赖任务'
     )
 
+    # 已执行失败的次数，写入失败日志时同步递增，避免每次统计日志数量
+    attempt_count = models.PositiveIntegerField(default=0, verbose_name='尝试次数')
+    # 失败后按指数退避安排的下次执行时间，为空表示立即可执行
+    next_attempt_at = models.DateTimeField(blank=True, null=True, verbose_name='下次执行时间')
+    # 批量开通邮箱时响应中没有该项结果、被推迟确认的次数，达到上限后按失败计入尝试次数
+    unknown_result_count = models.PositiveIntegerField(default=0, verbose_name='结果未知次数')
+
+    # 任务认领，保证同一任务只被一个执行进程处理
+    claimed_by = models.CharField(max_length=100, blank=True, null=True, verbose_name='认领进程')
+    claim_token = models.CharField(max_length=32, blank=True, null=True, verbose_name='认领令牌')
+    claimed_at = models.DateTimeField(blank=True, null=True, verbose_name='认领时间')
+    # 认领租约，执行进程定期续约；过期说明进程已退出，任务由回收器放回队列
+    lease_expires_at = models.DateTimeField(blank=True, null=True, verbose_name='租约到期时间')
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     completed_at = models.DateTimeField(blank=True, null=True, verbose_name='完成时间')
@@ -269,39 +565,239 @@ class AccountCreationTask(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['person', 'account_type']),
             models.Index(fields=['task_id']),
+            models.Index(fields=['status', 'attempt_count']),  # 用于筛选未达到重试上限的任务
+            models.Index(fields=['status', 'next_attempt_at']),  # 用于筛选已到执行时间的任务
+            models.Index(fields=['status', 'lease_expires_at']),  # 用于回收租约过期的任务
         ]
         unique_together = ['person', 'account_type', 'depends_on_task']
 
     def __str__(self):
         return f"{self.person.employee_number} - {self.get_account_type_display()} - {self.get_status_display()}"
 
-    def can_process(self):
-        """检查任务是否可以处理"""
-        if self.status != 'pending':
-            return False
+    # 可以被认领的任务状态
+    CLAIMABLE_STATUSES = ('pending', 'failed')
+
+    # 完成结果中存入 TaskPayload 的大字段
+    PAYLOAD_KEYS = ('service_response', 'department_mapping')
 
-        # 如果有依赖任务，检查依赖任务是否已完成
-        if self.depends_on_task:
-            return self.depends_on_task.status == 'completed'
+    @staticmethod
+    def get_lease_seconds():
+        """认领租约时长（秒）"""
+        from syncservice.services import ConfigService
+        return ConfigService.get_int_config('account_task_lease_seconds', 300)
+
+    @classmethod
+    def claim(cls, tasks, worker_id, lease_seconds=None):
+        """原子地将一批任务从 pending/failed 认领为 processing，返回认领成功的任务
+
+        支持 SKIP LOCKED 的数据库（PostgreSQL）先锁定候选行并跳过其他进程已锁定的行；
+        否则（SQLite）依靠带状态条件的 UPDATE 做比较并交换。
+        两种方式都只更新状态仍可认领的行，被其他进程抢先认领的任务不会出现在结果中。
+        认领同时设置租约，执行进程需在到期前调用 renew_leases 续约。
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return []
+
+        if lease_seconds is None:
+            lease_seconds = cls.get_lease_seconds()
+        claim_token = uuid.uuid4().hex
+        claimed_at = timezone.now()
+        lease_expires_at = claimed_at + timedelta(seconds=lease_seconds)
+        candidates = cls.objects.filter(pk__in=[task.pk for task in tasks], status__in=cls.CLAIMABLE_STATUSES)
+
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                locked_ids = list(candidates.select_for_update(skip_locked=True).values_list('pk', flat=True))
+                candidates = cls.objects.filter(pk__in=locked_ids)
+            candidates.update(
+                status='processing',
+                claimed_by=worker_id,
+                claim_token=claim_token,
+                claimed_at=claimed_at,
+                lease_expires_at=lease_expires_at,
+                updated_at=claimed_at,
+            )
 
+        claimed_ids = set(cls.objects.filter(
+            pk__in=[task.pk for task in tasks], claim_token=claim_token
+        ).values_list('pk', flat=True))
+
+        claimed = []
+        for task in tasks:
+            if task.pk in claimed_ids:
+                task.status = 'processing'
+                task.claimed_by = worker_id
+                task.claim_token = claim_token
+                task.claimed_at = claimed_at
+                task.lease_expires_at = lease_expires_at
+                claimed.append(task)
+        return claimed
+
+    @classmethod
+    def renew_leases(cls, tasks, lease_seconds=None):
+        """为仍由自己持有的任务续约（按认领令牌匹配），返回续约的任务数"""
+        tasks = [task for task in tasks if task.claim_token]
+        if not tasks:
+            return 0
+
+        if lease_seconds is None:
+            lease_seconds = cls.get_lease_seconds()
+        now = timezone.now()
+        lease_expires_at = now + timedelta(seconds=lease_seconds)
+
+        renewed = 0
+        for claim_token in {task.claim_token for task in tasks}:
+            renewed += cls.objects.filter(
+                pk__in=[task.pk for task in tasks if task.claim_token == claim_token],
+                status='processing',
+                claim_token=claim_token,
+            ).update(lease_expires_at=lease_expires_at)
+        return renewed
+
+    @classmethod
+    def reap_expired_leases(cls, now=None):
+        """把租约过期仍处于 processing 的任务放回队列，计一次失败尝试并写入日志，返回回收的任务数
+
+        没有租约的 processing 任务（认领机制之前标记的）超过租约时长未更新也会被回收。
+        单个任务回收失败只记录日志，不影响其他任务。
+        """
+        now = now or timezone.now()
+        lease_seconds = cls.get_lease_seconds()
+        expired = cls.objects.filter(status='processing').filter(
+            models.Q(lease_expires_at__lt=now)
+            | models.Q(lease_expires_at__isnull=True, updated_at__lt=now - timedelta(seconds=lease_seconds))
+        )
+
+        reaped = 0
+        for task in list(expired):
+            try:
+                if task.expire_lease(now):
+                    reaped += 1
+            except Exception as e:
+                logger.error(f'回收租约过期任务失败: {task.task_id}, 错误: {e}')
+        return reaped
+
+    def expire_lease(self, now=None):
+        """回收租约过期的任务，与续约或完成竞争时按认领令牌做比较并交换，返回是否回收成功"""
+        now = now or timezone.now()
+        next_attempt_at = now + timedelta(seconds=self.get_retry_delay(self.attempt_count + 1))
+
+        with transaction.atomic():
+            reaped = AccountCreationTask.objects.filter(
+                pk=self.pk, status='processing', claim_token=self.claim_token, lease_expires_at=self.lease_expires_at
+            ).update(
+                status='failed',
+                attempt_count=models.F('attempt_count') + 1,
+                next_attempt_at=next_attempt_at,
+                lease_expires_at=None,
+                updated_at=now,
+            )
+            if not reaped:
+                return False
+
+            self.refresh_from_db(fields=['status', 'attempt_count', 'next_attempt_at', 'lease_expires_at', 'updated_at'])
+            self._create_error_log(
+                f'任务租约已过期，执行进程 {self.claimed_by or "未知"} 可能已退出',
+                execution_context={
+                    'claimed_by': self.claimed_by,
+                    'claimed_at': self.claimed_at.isoformat() if self.claimed_at else None,
+                    'reaped_at': now.isoformat(),
+                },
+            )
         return True
 
-    def mark_processing(self):
-        """标记为处理中"""
-        self.status = 'processing'
-        self.save()
+    def defer(self, until):
+        """推迟到指定时间再执行，不计入尝试次数、不写失败日志（如外部服务熔断时），返回是否仍持有认领并更新成功"""
+        status = 'failed' if self.attempt_count else 'pending'
+        updated = AccountCreationTask.objects.filter(self._held_claim()).update(
+            status=status, next_attempt_at=until, lease_expires_at=None, updated_at=timezone.now()
+        )
+        if updated:
+            self.status = status
+            self.next_attempt_at = until
+            self.lease_expires_at = None
+        return bool(updated)
+
+    def defer_unknown_result(self):
+        """外部服务未返回该任务的结果时推迟确认，结果未知次数加一，退避时间随之增长，返回是否更新成功"""
+        until = timezone.now() + timedelta(seconds=self.get_retry_delay(self.unknown_result_count + 1))
+        status = 'failed' if self.attempt_count else 'pending'
+        updated = AccountCreationTask.objects.filter(self._held_claim()).update(
+            status=status,
+            unknown_result_count=models.F('unknown_result_count') + 1,
+            next_attempt_at=until,
+            lease_expires_at=None,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            self.refresh_from_db(fields=['status', 'unknown_result_count', 'next_attempt_at', 'lease_expires_at', 'updated_at'])
+        return bool(updated)
 
     def mark_completed(self, result_data=None):
-        """标记为完成"""
+        """标记为完成，返回是否仍持有认领并更新成功
+
+        外部服务原始响应等大字段压缩存入 TaskPayload，result_data 只保留精简字段。
+        租约已被回收（任务已交给其他进程）时不覆盖新持有者的状态。
+        """
+        compact_data, payload_data = self.split_result_data(result_data)
+        now = timezone.now()
+        with transaction.atomic():
+            if payload_data:
+                payload = TaskPayload.store(self, 'result', payload_data)
+                compact_data['payload_id'] = payload.pk
+            updated = AccountCreationTask.objects.filter(self._held_claim()).update(
+                status='completed', result_data=compact_data, completed_at=now, lease_expires_at=None, updated_at=now
+            )
+            if not updated:
+                transaction.set_rollback(True)
+                return False
+
         self.status = 'completed'
-        self.result_data = result_data
-        self.completed_at = timezone.now()
-        self.save()
+        self.result_data = compact_data
+        self.completed_at = now
+        self.lease_expires_at = None
+        return True
+
+    def _held_claim(self):
+        """本实例仍持有认领的条件：处于 processing 且认领令牌未变"""
+        return models.Q(pk=self.pk, status='processing', claim_token=self.claim_token)
+
+    @classmethod
+    def split_result_data(cls, result_data):
+        """拆分为 (精简字段, 大字段)，大字段为空时返回 None"""
+        if not isinstance(result_data, dict):
+            return result_data, None
+        compact_data = {key: value for key, value in result_data.items() if key not in cls.PAYLOAD_KEYS}
+        payload_data = {key: value for key, value in result_data.items() if key in cls.PAYLOAD_KEYS}
+        return compact_data, payload_data or None
+
+    def get_result_payload(self):
+        """按需加载完成时保存的外部服务原始响应等大字段"""
+        payload_id = (self.result_data or {}).get('payload_id') if isinstance(self.result_data, dict) else None
+        if payload_id:
+            payload = TaskPayload.objects.filter(pk=payload_id).first()
+            return payload.load() if payload else None
+        # 旧记录的大字段仍在 result_data 中
+        _, payload_data = self.split_result_data(self.result_data)
+        return payload_data
+
+    @classmethod
+    def backfill_attempt_counts(cls):
+        """按已有日志数回填 attempt_count（尝试次数字段上线前的旧任务），返回更新的任务数"""
+        from syncservice.models import AccountCreationLog
+
+        log_count = AccountCreationLog.objects.filter(task=models.OuterRef('pk')).values('task').annotate(
+            log_count=models.Count('pk')
+        ).values('log_count')
+        return cls.objects.annotate(log_count=models.Subquery(log_count)).filter(
+            attempt_count__lt=models.F('log_count')
+        ).update(attempt_count=models.Subquery(log_count))
 
     @property
     def retry_count(self):
-        """动态计算重试次数（通过日志数量）"""
-        return self.error_logs.count()
+        """重试次数（即 attempt_count）"""
+        return self.attempt_count
 
     @property
     def max_retries(self):
@@ -309,29 +805,80 @@ class AccountCreationTask(models.Model):
         from syncservice.services import ConfigService
         return ConfigService.get_int_config('account_creation_max_retries', 5)
 
+    @classmethod
+    def due_filter(cls, now=None):
+        """已到执行时间的待处理/失败任务条件"""
+        now = now or timezone.now()
+        return models.Q(status__in=cls.CLAIMABLE_STATUSES) & (
+            models.Q(next_attempt_at__isnull=True) | models.Q(next_attempt_at__lte=now)
+        )
+
+    @staticmethod
+    def get_retry_delay(attempt):
+        """第 attempt 次失败后的退避秒数：指数增长、有上限，并带随机抖动"""
+        from syncservice.services import ConfigService
+        base_seconds = ConfigService.get_float_config('account_creation_retry_base_seconds', 60)
+        max_seconds = ConfigService.get_float_config('account_creation_retry_max_seconds', 3600)
+
+        delay = min(base_seconds * (2 ** max(attempt - 1, 0)), max_seconds)
+        # 在 [delay/2, delay] 之间随机，避免同时失败的任务同时重试
+        return delay / 2 + random.uniform(0, delay / 2)
+
     def should_retry(self):
         """检查是否应该重试"""
         return self.status == 'failed' and self.retry_count < self.max_retries
 
     def mark_failed(self, error_message, error_details=None, execution_context=None):
-        """标记为失败并记录错误日志"""
+        """标记为失败并记录错误日志，租约已被回收时不做修改，返回是否更新成功"""
+        # 按退避安排下次执行时间（读配置放在事务外，SQLite 下事务内先读后写容易触发锁冲突）
+        now = timezone.now()
+        next_attempt_at = now + timedelta(seconds=self.get_retry_delay(self.attempt_count + 1))
+
+        with transaction.atomic():
+            # 原子递增尝试次数，作为本次日志的执行次数
+            updated = AccountCreationTask.objects.filter(self._held_claim()).update(
+                status='failed',
+                attempt_count=models.F('attempt_count') + 1,
+                next_attempt_at=next_attempt_at,
+                lease_expires_at=None,
+                updated_at=now,
+            )
+            if not updated:
+                return False
+            self.refresh_from_db(fields=['status', 'attempt_count', 'next_attempt_at', 'lease_expires_at', 'updated_at'])
+
+            # 创建错误日志记录
+            self._create_error_log(error_message, error_details, execution_context)
+        return True
+
+    def _create_error_log(self, error_message, error_details=None, execution_context=None):
+        """以当前 attempt_count 作为执行次数写入错误日志
+
+        未回填 attempt_count 的旧任务已有日志时，接着已有的最大执行次数编号，避免违反 (task, execution_attempt) 唯一约束。
+        """
         import traceback
         from syncservice.models import AccountCreationLog
 
-        self.status = 'failed'
-        self.save()
+        last_attempt = self.error_logs.aggregate(last_attempt=models.Max('execution_attempt'))['last_attempt'] or 0
+        execution_attempt = max(self.attempt_count, last_attempt + 1)
+
+        stack_trace = traceback.format_exc()
+        details = {
+            'error_type': type(error_details).__name__ if error_details else 'Exception',
+            'stack_trace': stack_trace,
+            'additional_info': error_details
+        } if error_details or stack_trace != 'NoneType: None\n' else None
+
+        if details:
+            # 堆栈等完整详情压缩存入 TaskPayload，日志只保留错误类型
+            payload = TaskPayload.store(self, 'error_details', details)
+            details = {'error_type': details['error_type'], 'payload_id': payload.pk}
 
-        # 创建错误日志记录
-        execution_attempt = self.retry_count + 1  # 当前执行次数
         AccountCreationLog.objects.create(
             task=self,
             execution_attempt=execution_attempt,
             error_message=error_message,
-            error_details={
-                'error_type': type(error_details).__name__ if error_details else 'Exception',
-                'stack_trace': traceback.format_exc(),
-                'additional_info': error_details
-            } if error_details or traceback.format_exc() != 'NoneType: None\n' else None,
+            error_details=details,
             execution_context=execution_context
         )
 
@@ -364,6 +911,99 @@ class AccountCreationLog(models.Model):
     def __str__(self):
         return f"{self.task.task_id} - 第{self.execution_attempt}次执行 - {self.error_message[:50]}..."
 
+    def get_full_error_details(self):
+        """按需加载完整错误详情（含堆栈），旧记录直接返回 error_details"""
+        payload_id = self.error_details.get('payload_id') if isinstance(self.error_details, dict) else None
+        if payload_id:
+            payload = TaskPayload.objects.filter(pk=payload_id).first()
+            return payload.load() if payload else None
+        return self.error_details
+
+
+class TaskPayload(models.Model):
+    """任务大字段存储 - 外部服务原始响应、错误堆栈等，压缩后只追加写入
+
+    任务表和日志表只保留精简字段和 payload_id，查看详情时再按需加载，
+    列表接口和后台列表页不会读取这些数据。
+    """
+    KIND_CHOICES = [
+        ('result', '执行结果'),
+        ('error_details', '错误详情'),
+    ]
+
+    task = models.ForeignKey(AccountCreationTask, on_delete=models.CASCADE, related_name='payloads', verbose_name='任务')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='类型')
+    # zlib 压缩的 JSON
+    content = models.BinaryField(verbose_name='内容')
+    raw_size = models.PositiveIntegerField(default=0, verbose_name='原始大小')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '任务详情数据'
+        verbose_name_plural = '任务详情数据'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['task', 'kind']),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id} - {self.get_kind_display()}"
+
+    @classmethod
+    def store(cls, task, kind, data):
+        """压缩保存一份数据"""
+        raw = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        return cls.objects.create(task=task, kind=kind, content=zlib.compress(raw), raw_size=len(raw))
+
+    def load(self):
+        """解压并返回原始数据"""
+        return json.loads(zlib.decompress(bytes(self.content)).decode('utf-8'))
+
+
+class ProviderCircuit(models.Model):
+    """外部账号服务熔断状态 - 多个执行进程共享"""
+    STATE_CHOICES = [
+        ('closed', '正常'),
+        ('open', '熔断'),
+        ('half_open', '探测中'),
+    ]
+
+    provider = models.CharField(max_length=20, unique=True, verbose_name='服务')
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='closed', verbose_name='状态')
+    failure_count = models.IntegerField(default=0, verbose_name='连续失败次数')
+    # 熔断时为允许探测的时间，探测中为本次探测的截止时间
+    retry_at = models.DateTimeField(blank=True, null=True, verbose_name='下次探测时间')
+    opened_at = models.DateTimeField(blank=True, null=True, verbose_name='熔断时间')
+    last_error = models.TextField(blank=True, null=True, verbose_name='最近错误')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '服务熔断状态'
+        verbose_name_plural = '服务熔断状态'
+        ordering = ['provider']
+
+    def __str__(self):
+        return f"{self.provider} - {self.get_state_display()}"
+
+
+class ServiceToken(models.Model):
+    """外部服务访问 token - 多个进程共享，刷新时由刷新锁保证只有一个进程请求新 token"""
+    name = models.CharField(max_length=200, unique=True, verbose_name='名称')
+    token = models.TextField(blank=True, null=True, verbose_name='Token')
+    expires_at = models.DateTimeField(blank=True, null=True, verbose_name='过期时间')
+    # 刷新锁的截止时间，持有者退出后锁自然过期
+    refresh_lock_until = models.DateTimeField(blank=True, null=True, verbose_name='刷新锁截止时间')
+    refreshed_at = models.DateTimeField(blank=True, null=True, verbose_name='刷新时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '服务访问Token'
+        verbose_name_plural = '服务访问Token'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
 
 class AccountCreationRequest(models.Model):
     """账号创建请求 - 存储接口接收的创建请求"""
@@ -0,0 +1,151 @@
+import logging
+import uuid
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from syncservice.models import AccountCreationTask, HrPerson
+
+logger = logging.getLogger(__name__)
+
+
+class AccountTaskPlanner:
+    """账号任务规划器
+
+    用一条带 NOT EXISTS 子查询的 SQL 找出缺少账号任务的 (人员, 账号类型)，
+    只加载规划需要的列，并按块流式返回结果。
+    """
+
+    # 规划和创建任务时需要的人员字段
+    PERSON_FIELDS = ('person_id', 'employee_number', 'full_name', 'person_dept')
+
+    def __init__(self, account_types: Iterable[str], task_statuses: Iterable[str] = None, chunk_size: int = 500):
+        self.account_types = list(account_types)
+        # 为 None 时任意状态的已有任务都视为存在
+        self.task_statuses = list(task_statuses) if task_statuses else None
+        self.chunk_size = chunk_size
+
+    def iter_missing(self, persons_query) -> Iterator[List[HrPerson]]:
+        """按块返回缺少任务的人员，每个人员的 missing_account_types 为缺失的账号类型列表"""
+        if not self.account_types:
+            return
+
+        queryset = self._annotate(persons_query).order_by('pk')
+
+        chunk = []
+        for person in queryset.iterator(chunk_size=self.chunk_size):
+            person.missing_account_types = [
+                account_type for account_type in self.account_types
+                if not getattr(person, self._flag(account_type))
+            ]
+            chunk.append(person)
+
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def get_missing_map(self, person_ids: Iterable[int]) -> Dict[int, List[str]]:
+        """返回指定人员缺失的账号类型 {person_id: [account_type, ...]}，不缺失的人员不出现在结果中"""
+        person_ids = list(person_ids)
+        if not person_ids:
+            return {}
+
+        missing_map = {}
+        for chunk in self.iter_missing(HrPerson.objects.filter(pk__in=person_ids)):
+            for person in chunk:
+                missing_map[person.pk] = person.missing_account_types
+        return missing_map
+
+    def _annotate(self, persons_query):
+        """为每种账号类型添加 EXISTS 标记，并只保留至少缺一种任务的人员"""
+        annotations = {}
+        for account_type in self.account_types:
+            tasks = AccountCreationTask.objects.filter(person=OuterRef('pk'), account_type=account_type)
+            if self.task_statuses:
+                tasks = tasks.filter(status__in=self.task_statuses)
+            annotations[self._flag(account_type)] = Exists(tasks)
+
+        missing_condition = reduce(or_, [Q(**{self._flag(account_type): False}) for account_type in self.account_types])
+
+        return persons_query.only(*self.PERSON_FIELDS).annotate(**annotations).filter(missing_condition)
+
+    @staticmethod
+    def _flag(account_type: str) -> str:
+        return f'has_{account_type}_task'
+
+
+class AccountTaskMaterializer:
+    """账号任务批量生成器
+
+    为一批人员一次性插入 idaas/welink/email 任务，并批量设置依赖链，
+    全部操作在同一个事务中完成。
+    """
+
+    # 账号创建顺序，同一人员的任务按此顺序串成依赖链
+    ACCOUNT_ORDER = {
+        'idaas': 1,
+        'welink': 2,
+        'email': 3
+    }
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+
+    def materialize(self, plans: Iterable[Tuple[HrPerson, Iterable[str]]]) -> List[AccountCreationTask]:
+        """plans 为 (人员, 账号类型列表)，返回创建的任务"""
+        chains = []
+        for person, account_types in plans:
+            sorted_account_types = sorted(account_types, key=lambda x: self.ACCOUNT_ORDER.get(x, 999))
+            chain = [
+                AccountCreationTask(
+                    task_id=self.generate_task_id(person.employee_number, account_type),
+                    person=person,
+                    account_type=account_type,
+                )
+                for account_type in sorted_account_types
+            ]
+            if chain:
+                chains.append(chain)
+
+        tasks = [task for chain in chains for task in chain]
+        if not tasks:
+            return []
+
+        with transaction.atomic():
+            AccountCreationTask.objects.bulk_create(tasks, batch_size=self.batch_size)
+            self._ensure_primary_keys(tasks)
+
+            # 批量设置依赖：链中每个任务依赖前一个任务
+            dependent_tasks = []
+            for chain in chains:
+                for previous_task, task in zip(chain, chain[1:]):
+                    task.depends_on_task = previous_task
+                    dependent_tasks.append(task)
+
+            if dependent_tasks:
+                AccountCreationTask.objects.bulk_update(dependent_tasks, ['depends_on_task'], batch_size=self.batch_size)
+
+        logger.info(f'批量创建任务: {len(chains)} 个人员，{len(tasks)} 个任务')
+        return tasks
+
+    @staticmethod
+    def generate_task_id(employee_number: str, account_type: str) -> str:
+        """生成唯一的任务ID（同一秒内多次运行也不会冲突）"""
+        return f"{employee_number}_{account_type}_{uuid.uuid4().hex[:12]}"
+
+    def _ensure_primary_keys(self, tasks: List[AccountCreationTask]):
+        """数据库不支持批量插入返回主键时，按 task_id 回查主键"""
+        missing = [task for task in tasks if task.pk is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            id_map = dict(
+                AccountCreationTask.objects.filter(task_id__in=[task.task_id for task in batch]).values_list('task_id', 'id')
+            )
+            for task in batch:
+                task.pk = id_map[task.task_id]
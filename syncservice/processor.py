@@ -0,0 +1,447 @@
+import logging
+import os
+import socket
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from syncservice.breaker import CircuitOpenError
+from syncservice.models import AccountCreationTask, HrPersonAccount
+from syncservice.services import AccountCreationService, ConfigService, MailboxResultUnknown
+
+logger = logging.getLogger(__name__)
+
+
+class AccountTaskProcessor:
+    """账号创建任务执行器
+
+    用线程池并发执行互不依赖的任务，每种账号类型的外部调用受各自的并发上限约束。
+    任务按依赖关系调度：父任务完成后，其待处理的下游任务进入就绪队列，在同一次运行中执行。
+    任务执行前先原子认领，多个进程同时运行时同一任务只会被其中一个处理。
+    就绪的邮箱任务合并成批，一次 EnableMailboxList 请求开通多个邮箱。
+    任务状态变更和日志写入仍按单个任务进行，workers 为 1 时在当前线程顺序执行。
+    """
+
+    # 各账号类型默认的最大并发调用数
+    DEFAULT_PROVIDER_LIMITS = {
+        'idaas': 4,
+        'welink': 4,
+        'email': 2,
+    }
+
+    def __init__(self, service: AccountCreationService = None, workers: int = 1,
+                 provider_limits: Dict[str, int] = None, output: Callable[[str], None] = None,
+                 worker_id: str = None, email_batch_size: int = 1, lease_seconds: int = 300):
+        self.service = service or AccountCreationService()
+        self.workers = max(int(workers), 1)
+        # 每次邮箱开通请求合并的任务数，为 1 时逐个开通
+        self.email_batch_size = max(int(email_batch_size), 1)
+        self.output = output
+        # 认领任务时记录的执行进程标识
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        # 认领租约时长，执行期间由心跳线程按三分之一租约的间隔续约
+        self.lease_seconds = max(int(lease_seconds), 3)
+        self._in_flight: Dict[int, AccountCreationTask] = {}
+
+        limits = dict(self.DEFAULT_PROVIDER_LIMITS)
+        limits.update(provider_limits or {})
+        self._semaphores = {
+            account_type: threading.BoundedSemaphore(max(int(limit), 1))
+            for account_type, limit in limits.items()
+        }
+        self._stats_lock = threading.Lock()
+        self._output_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, workers: int = None, **kwargs) -> 'AccountTaskProcessor':
+        """根据 SyncConfig 创建执行器，读取 account_processing_workers、{账号类型}_max_concurrency 和 email_batch_size"""
+        if workers is None:
+            workers = ConfigService.get_int_config('account_processing_workers', 1)
+        provider_limits = {
+            account_type: ConfigService.get_int_config(f'{account_type}_max_concurrency', default)
+            for account_type, default in cls.DEFAULT_PROVIDER_LIMITS.items()
+        }
+        kwargs.setdefault('email_batch_size', ConfigService.get_int_config('email_batch_size', 1))
+        kwargs.setdefault('lease_seconds', AccountCreationTask.get_lease_seconds())
+        return cls(workers=workers, provider_limits=provider_limits, **kwargs)
+
+    @staticmethod
+    def fetch_due_tasks(max_tasks: int) -> List[AccountCreationTask]:
+        """获取已到执行时间的待处理任务（失败任务需重试次数小于最大重试次数）
+
+        只取无依赖或依赖已完成的任务，等待中的下游任务由 plan() 从批次内的父任务逐层加载，
+        避免永远无法就绪的下游任务占满 max_tasks 名额。
+        """
+        max_retries = ConfigService.get_int_config('account_creation_max_retries', 5)
+        return list(
+            AccountCreationTask.objects.filter(
+                AccountCreationTask.due_filter(),
+                Q(status='pending') | Q(attempt_count__lt=max_retries),
+                Q(depends_on_task__isnull=True) | Q(depends_on_task__status='completed'),
+            ).select_related('person').order_by('created_at')[:max_tasks]
+        )
+
+    def plan(self, tasks: Iterable[AccountCreationTask]) -> Tuple[
+            List[AccountCreationTask], Dict[int, List[AccountCreationTask]], List[AccountCreationTask]]:
+        """按依赖关系划分任务，返回 (可立即执行, {父任务ID: 等待中的下游任务}, 被阻塞)
+
+        批次内任务的待处理下游任务会被逐层加载（每层一次查询），
+        批次外依赖任务的状态一次查询批量获取，不再逐个访问 depends_on_task。
+        """
+        tasks = list(tasks)
+        known = {task.pk: task for task in tasks}
+
+        frontier = list(known)
+        while frontier:
+            dependents = list(
+                AccountCreationTask.objects.filter(depends_on_task_id__in=frontier, status='pending')
+                .exclude(pk__in=list(known))
+                .select_related('person')
+                .order_by('created_at')
+            )
+            for task in dependents:
+                known[task.pk] = task
+            frontier = [task.pk for task in dependents]
+
+        external_ids = {
+            task.depends_on_task_id for task in known.values()
+            if task.depends_on_task_id and task.depends_on_task_id not in known
+        }
+        dependency_status = dict(
+            AccountCreationTask.objects.filter(pk__in=external_ids).values_list('id', 'status')
+        ) if external_ids else {}
+
+        ready = []
+        waiting = {}
+        blocked = []
+        for task in known.values():
+            parent_id = task.depends_on_task_id
+            if task.status not in AccountCreationTask.CLAIMABLE_STATUSES:
+                blocked.append(task)
+            elif parent_id is None or dependency_status.get(parent_id) == 'completed':
+                ready.append(task)
+            elif parent_id in known:
+                waiting.setdefault(parent_id, []).append(task)
+            else:
+                blocked.append(task)
+
+        return ready, waiting, blocked
+
+    def process(self, tasks: Iterable[AccountCreationTask]) -> Dict[str, int]:
+        """执行一批任务及其在本次运行中就绪的下游任务，返回 processed/success/failed/skipped/deferred 统计"""
+        stats = {'processed': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'deferred': 0}
+        tasks = list(tasks)
+        batch_ids = {task.pk for task in tasks}
+
+        ready, waiting, blocked = self.plan(tasks)
+        for task in blocked:
+            if task.pk in batch_ids:
+                self._write(f'跳过任务 {task.task_id}: 等待依赖任务完成')
+                stats['skipped'] += 1
+
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop_heartbeat,), name='account-task-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            if self.workers == 1:
+                self._run_sequential(self._claim(ready, stats), waiting, stats)
+            else:
+                self._run_concurrent(self._claim(ready, stats), waiting, stats)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+
+        # 父任务失败或被阻塞，剩余的下游任务留到之后的运行
+        for dependents in waiting.values():
+            for task in dependents:
+                if task.pk in batch_ids:
+                    self._write(f'跳过任务 {task.task_id}: 依赖任务未完成')
+                    stats['skipped'] += 1
+
+        return stats
+
+    def _claim(self, tasks: List[AccountCreationTask], stats: Dict[str, int]) -> List[AccountCreationTask]:
+        """认领任务，已被其他进程认领的任务计入跳过；认领失败时这些任务留到之后的运行"""
+        if not tasks:
+            return []
+        try:
+            claimed = AccountCreationTask.claim(tasks, self.worker_id, self.lease_seconds)
+        except Exception as e:
+            logger.exception('认领任务失败')
+            self._write(f'认领任务失败，留到之后的运行: {", ".join(task.task_id for task in tasks)}, 错误: {e}')
+            stats['skipped'] += len(tasks)
+            return []
+        with self._stats_lock:
+            for task in claimed:
+                self._in_flight[task.pk] = task
+        if len(claimed) < len(tasks):
+            claimed_ids = {task.pk for task in claimed}
+            for task in tasks:
+                if task.pk not in claimed_ids:
+                    self._write(f'跳过任务 {task.task_id}: 已被其他进程认领')
+                    stats['skipped'] += 1
+        return claimed
+
+    def _heartbeat(self, stop_event: threading.Event):
+        """定期为执行中的任务续约，进程退出后租约自然过期，由回收器放回队列"""
+        interval = self.lease_seconds / 3
+        try:
+            while not stop_event.wait(interval):
+                with self._stats_lock:
+                    tasks = list(self._in_flight.values())
+                try:
+                    AccountCreationTask.renew_leases(tasks, self.lease_seconds)
+                except Exception as e:
+                    logger.warning(f'任务续约失败: {e}')
+        finally:
+            connection.close()
+
+    def _run_sequential(self, ready: List[AccountCreationTask], waiting: Dict[int, List[AccountCreationTask]],
+                        stats: Dict[str, int]):
+        """在当前线程按就绪顺序执行，邮箱任务攒够一批或没有其他任务时合并执行"""
+        queue = deque(ready)
+        email_batch = []
+        while queue or email_batch:
+            if queue:
+                task = queue.popleft()
+                if not self._is_batched(task):
+                    outcomes = self._execute([task], self._process_single, task)
+                else:
+                    email_batch.append(task)
+                    if len(email_batch) < self.email_batch_size:
+                        continue
+                    outcomes, email_batch = self._execute(email_batch, self._process_email_batch, email_batch), []
+            else:
+                outcomes, email_batch = self._execute(email_batch, self._process_email_batch, email_batch), []
+
+            for task, succeeded in outcomes:
+                self._record(task, stats, succeeded)
+                if succeeded:
+                    queue.extend(self._claim(waiting.pop(task.pk, []), stats))
+
+    def _run_concurrent(self, ready: List[AccountCreationTask], waiting: Dict[int, List[AccountCreationTask]],
+                        stats: Dict[str, int]):
+        """用线程池执行，父任务完成后下游任务进入就绪队列"""
+        email_batch = []
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='account-task') as executor:
+            futures = set()
+
+            def submit(tasks):
+                for task in tasks:
+                    if not self._is_batched(task):
+                        futures.add(executor.submit(self._run_in_thread, self._execute, [task], self._process_single, task))
+                        continue
+                    email_batch.append(task)
+                    if len(email_batch) >= self.email_batch_size:
+                        submit_email_batch()
+
+            def submit_email_batch():
+                batch = email_batch[:]
+                email_batch.clear()
+                futures.add(executor.submit(self._run_in_thread, self._execute, batch, self._process_email_batch, batch))
+
+            submit(ready)
+            while futures or email_batch:
+                # 没有其他任务在执行时，不再等待凑满一批
+                if not futures:
+                    submit_email_batch()
+
+                done, pending = wait(futures, return_when=FIRST_COMPLETED)
+                futures.clear()
+                futures.update(pending)
+                for future in done:
+                    for task, succeeded in future.result():
+                        self._record(task, stats, succeeded)
+                        if succeeded:
+                            submit(self._claim(waiting.pop(task.pk, []), stats))
+
+    def _execute(self, tasks: List[AccountCreationTask], func, *args) -> List[Tuple[AccountCreationTask, Optional[bool]]]:
+        """执行一个或一批任务，未预期的异常只影响这些任务，计为失败，不中断本次运行"""
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.exception(f'执行任务异常: {", ".join(task.task_id for task in tasks)}')
+            self._write(f'执行任务异常: {", ".join(task.task_id for task in tasks)}, 错误: {e}')
+            return [(task, False) for task in tasks]
+
+    @staticmethod
+    def _run_in_thread(func, *args):
+        """工作线程入口，执行结束后关闭本线程的数据库连接"""
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+
+    def _is_batched(self, task: AccountCreationTask) -> bool:
+        return task.account_type == 'email' and self.email_batch_size > 1
+
+    def _process_single(self, task: AccountCreationTask) -> List[Tuple[AccountCreationTask, Optional[bool]]]:
+        return [(task, self._process_task(task))]
+
+    def _process_task(self, task: AccountCreationTask) -> Optional[bool]:
+        """执行单个任务，返回是否成功，因服务熔断推迟时返回 None"""
+        department_code = None
+        try:
+            self._write(f'处理任务: {task.task_id} - {task.person.employee_number} - {task.get_account_type_display()}')
+
+            department_code = self.get_department_code(task.person)
+            if not department_code:
+                raise Exception(f"无法获取部门代码，跳过账号创建")
+
+            # 只在外部调用期间占用该账号类型的并发名额
+            with self._get_semaphore(task.account_type):
+                result = self.service.create_account(task.person, task.account_type, department_code)
+
+        except CircuitOpenError as e:
+            # 服务熔断时未发出调用，推迟任务且不计入尝试次数
+            self._update_state(task, AccountCreationTask.defer, e.retry_at)
+            self._write(f'任务推迟: {task.task_id}, {e}')
+            return None
+
+        except Exception as e:
+            self._update_state(task, self._fail_task, e, department_code)
+            return False
+
+        return self._update_state(task, self._complete_task, result)
+
+    def _process_email_batch(self, tasks: List[AccountCreationTask]) -> List[Tuple[AccountCreationTask, Optional[bool]]]:
+        """一次请求为一批邮箱任务开通邮箱，按 SAMAccountName 将每项结果对应回任务"""
+        self._write(f'批量开通邮箱: {len(tasks)} 个任务 ({", ".join(task.task_id for task in tasks)})')
+
+        try:
+            with self._get_semaphore('email'):
+                results = self.service.create_email_accounts([task.person for task in tasks])
+        except CircuitOpenError as e:
+            for task in tasks:
+                self._update_state(task, AccountCreationTask.defer, e.retry_at)
+            self._write(f'任务推迟: {len(tasks)} 个邮箱任务, {e}')
+            return [(task, None) for task in tasks]
+        except Exception as e:
+            # 整个请求失败，本批任务都记为失败
+            results = {task.person.pk: e for task in tasks}
+
+        # 结果未知次数达到上限后按失败处理，计入尝试次数，最终受最大重试次数约束
+        max_unknown_results = ConfigService.get_int_config('email_unknown_result_max_defers', 3)
+
+        outcomes = []
+        for task in tasks:
+            result = results.get(task.person.pk)
+            if isinstance(result, MailboxResultUnknown) and task.unknown_result_count < max_unknown_results:
+                # 无法确认是否已开通，按结果未知次数退避推迟后重新执行，不计入尝试次数
+                self._update_state(task, AccountCreationTask.defer_unknown_result)
+                self._write(f'任务推迟: {task.task_id}, {result}')
+                outcomes.append((task, None))
+            elif isinstance(result, Exception):
+                self._update_state(task, self._fail_task, result)
+                outcomes.append((task, False))
+            else:
+                outcomes.append((task, self._update_state(task, self._complete_task, result)))
+        return outcomes
+
+    def _update_state(self, task: AccountCreationTask, update, *args) -> bool:
+        """写入单个任务的状态，写库失败只记录日志，不影响同批其他任务
+
+        写入失败的任务仍处于执行中，本次运行结束后不再续约，租约过期后由回收器放回队列。
+        """
+        try:
+            update(task, *args)
+            return True
+        except Exception as e:
+            logger.exception(f'任务状态写入失败: {task.task_id}')
+            self._write(f'任务 {task.task_id} 状态写入失败，租约过期后重新执行: {e}')
+            return False
+
+    def _complete_task(self, task: AccountCreationTask, result: Dict):
+        """标记任务完成并更新 HrPersonAccount 记录"""
+        if not task.mark_completed(result):
+            # 租约已被回收并交给其他进程，账号已开通，仍记录账号信息
+            self._write(f'任务 {task.task_id} 的租约已失效，不再修改任务状态')
+
+        account, created = HrPersonAccount.objects.get_or_create(
+            person=task.person,
+            account_type=task.account_type,
+            defaults={
+                'account_identifier': result.get('account_identifier'),
+                'is_created': True
+            }
+        )
+
+        if not created:
+            account.account_identifier = result.get('account_identifier')
+            account.is_created = True
+            account.save()
+
+        self._write(f'任务完成: {task.task_id}')
+
+    def _fail_task(self, task: AccountCreationTask, error: Exception, department_code: str = None):
+        """标记任务失败并记录日志"""
+        error_msg = str(error)
+        self._write(f'任务失败: {task.task_id}, 错误: {error_msg}')
+
+        # 构建执行上下文
+        execution_context = {
+            'person_id': task.person.employee_number,
+            'account_type': task.account_type,
+            'department_code': department_code,
+            'execution_attempt': task.attempt_count + 1,
+            'processed_at': timezone.now().isoformat()
+        }
+
+        # 标记为失败并记录日志
+        if not task.mark_failed(error_msg, error_details={'exception': error_msg}, execution_context=execution_context):
+            self._write(f'任务 {task.task_id} 的租约已失效，不再修改任务状态')
+            return
+
+        # 检查是否需要重试
+        if task.should_retry():
+            self._write(
+                f'任务 {task.task_id} 将在 {timezone.localtime(task.next_attempt_at):%Y-%m-%d %H:%M:%S} 后重试 '
+                f'(重试次数: {task.attempt_count}/{task.max_retries})'
+            )
+        else:
+            self._write(f'任务 {task.task_id} 达到最大重试次数，标记为最终失败')
+
+    @staticmethod
+    def get_department_code(person) -> Optional[str]:
+        """获取人员的部门代码"""
+        department_code = None
+        if person.person_dept and isinstance(person.person_dept, list):
+            # 部门信息在 person_dept 的第一个元素
+            dept_info = person.person_dept[0]
+            department_code = dept_info.get('department_code') if isinstance(dept_info, dict) else None
+
+        if not department_code:
+            # 尝试从其他字段获取部门代码
+            department_code = getattr(person, 'department_code', None)
+
+        return department_code
+
+    def _get_semaphore(self, account_type: str) -> threading.BoundedSemaphore:
+        semaphore = self._semaphores.get(account_type)
+        if semaphore is None:
+            with self._stats_lock:
+                semaphore = self._semaphores.setdefault(account_type, threading.BoundedSemaphore(1))
+        return semaphore
+
+    def _record(self, task: AccountCreationTask, stats: Dict[str, int], succeeded: Optional[bool]):
+        with self._stats_lock:
+            # 任务已结束，不再续约
+            self._in_flight.pop(task.pk, None)
+            if succeeded is None:
+                stats['deferred'] += 1
+                return
+            stats['processed'] += 1
+            stats['success' if succeeded else 'failed'] += 1
+
+    def _write(self, message: str):
+        if self.output is None:
+            logger.info(message)
+            return
+        with self._output_lock:
+            self.output(message)
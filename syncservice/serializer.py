@@ -19,6 +19,13 @@ class HrPersonSerializer(serializers.ModelSerializer):
     class Meta:
         model = HrPerson
         fields = '__all__'
+        # 内容摘要、待规划标记和派生的身份字段由HR同步维护
+        read_only_fields = ['content_hash', 'planning_dirty_at', 'name_pinyin', 'account_username', 'mail_alias']
+
+    def update(self, instance, validated_data):
+        # 手工修改后清空内容摘要，下次HR同步时以HR数据覆盖
+        validated_data['content_hash'] = None
+        return super().update(instance, validated_data)
 
 
 class HrPersonDetailSerializer(serializers.ModelSerializer):
@@ -29,6 +36,7 @@ class HrPersonDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = HrPerson
         fields = '__all__'
+        read_only_fields = ['content_hash', 'planning_dirty_at', 'name_pinyin', 'account_username', 'mail_alias']
 
     def get_account_status(self, obj):
         """获取账号创建状态统计"""
@@ -117,6 +125,15 @@ class AccountCreationLogSerializer(serializers.ModelSerializer):
         }
 
 
+class AccountCreationLogDetailSerializer(AccountCreationLogSerializer):
+    """账号创建日志详细序列化器，包含按需加载的完整错误详情（含堆栈）"""
+    full_error_details = serializers.SerializerMethodField()
+
+    @extend_schema_field(OpenApiTypes.OBJECT)
+    def get_full_error_details(self, obj):
+        return obj.get_full_error_details()
+
+
 class AccountCreationTaskSerializer(serializers.ModelSerializer):
     """账号创建任务序列化器"""
     person_info = serializers.SerializerMethodField()
@@ -127,8 +144,10 @@ class AccountCreationTaskSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = AccountCreationTask
-        fields = '__all__'
-        read_only_fields = ['task_id', 'result_data', 'created_at', 'updated_at', 'completed_at']
+        # 认领令牌只在执行进程内部使用，不对外暴露
+        exclude = ['claim_token']
+        read_only_fields = ['task_id', 'result_data', 'attempt_count', 'unknown_result_count', 'claimed_by', 'claimed_at',
+                            'lease_expires_at', 'created_at', 'updated_at', 'completed_at']
 
     @extend_schema_field(OpenApiTypes.OBJECT)
     def get_person_info(self, obj):
@@ -141,7 +160,7 @@ class AccountCreationTaskSerializer(serializers.ModelSerializer):
 
     @extend_schema_field(OpenApiTypes.INT)
     def get_retry_count(self, obj):
-        return obj.retry_count
+        return obj.attempt_count
 
     @extend_schema_field(AccountCreationLogSerializer(many=True))
     def get_error_logs(self, obj):
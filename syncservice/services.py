@@ -1,48 +1,53 @@
+import copy
 import os
-import requests
 import json
 import hashlib
-from datetime import datetime, timedelta
-from django.utils import timezone
 from django.conf import settings
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
-try:
-    import pypinyin
-    PYPINYIN_AVAILABLE = True
-except ImportError:
-    PYPINYIN_AVAILABLE = False
-
-from syncservice.models import HrPerson, DepartmentMapping, PersonTypeMapping, AccountCreationTask, AccountCreationLog, SyncConfig
+from syncservice.models import HrPerson, EmailAllocation, DepartmentMapping, PersonTypeMapping, AccountCreationTask, AccountCreationLog
+from syncservice.breaker import CircuitBreaker
+from syncservice.caches import ConfigCache, get_config_cache, get_mapping_snapshot
+from syncservice.identity import convert_to_pinyin, generate_username
+from syncservice.tokens import get_token_store
+from syncservice.transport import get_transport
 
 logger = logging.getLogger(__name__)
 
 
+class MailboxResultUnknown(Exception):
+    """批量开通请求成功，但响应的 success/fail 中都没有该邮箱，无法判断是否已开通"""
+
+
 class AccountCreationService:
     """账号创建服务"""
 
     def __init__(self):
-        self.timeout = 30  # 默认超时时间
-        self._token_cache = {}  # token 缓存
+        self.transport = get_transport()  # 进程内共享的连接池
+        self._breakers = {}  # 各外部服务的熔断器
 
     def create_account(self, person: HrPerson, account_type: str, department_code: str) -> Dict[str, Any]:
-        """创建账号"""
+        """创建账号，外部服务熔断时抛出 CircuitOpenError"""
         if account_type == 'idaas':
-            return self._create_idaas_account(person, department_code)
+            return self._get_breaker(account_type).call(self._create_idaas_account, person, department_code)
         elif account_type == 'welink':
-            return self._create_welink_account(person, department_code)
+            return self._get_breaker(account_type).call(self._create_welink_account, person, department_code)
         elif account_type == 'email':
-            return self._create_email_account(person)
+            return self._get_breaker(account_type).call(self._create_email_account, person)
         else:
             raise ValueError(f"不支持的账号类型: {account_type}")
 
+    def _get_breaker(self, provider: str) -> CircuitBreaker:
+        """获取外部服务的熔断器（熔断状态保存在数据库，多个进程共享）"""
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = self._breakers.setdefault(provider, CircuitBreaker.from_config(provider))
+        return breaker
+
     def _create_idaas_account(self, person: HrPerson, department_code: str) -> Dict[str, Any]:
         """创建 IDAAS 账号"""
         try:
-            # 获取企业级 token
-            enterprise_token = self._get_idaas_enterprise_token()
-
             # 获取部门映射
             department_mapping = self._get_department_mapping(department_code)
             # 检查 OU 是否可用
@@ -54,15 +59,15 @@ class AccountCreationService:
             user_type = mapping.idaas_user_type if mapping else "supplier"
 
             # 生成用户名和邮箱
-            username = self._generate_username(person.employee_number, person.full_name)
-            email = self._generate_unique_email(person.full_name, person.employee_number, person.person_type)
+            username = self._get_username(person)
+            email = self._generate_unique_email(person)
 
             # 构建请求数据
             data = {
                 "userInfo": {
                     "employeeNumber": person.employee_number,
                     "name": person.full_name,
-                    "englishName": self._convert_to_pinyin(person.full_name),
+                    "englishName": self._get_name_pinyin(person),
                     "userName": username,
                     "userType": user_type,
                     "email": email,
@@ -79,12 +84,7 @@ class AccountCreationService:
             enterprise_id = ConfigService.get_config('idaas_enterprise_id')
             url = f"https://apig.hieds.net/api/idaas/idm-openapi/enterprise/{enterprise_id}/user/onboarding"
 
-            headers = {
-                'Authorization': enterprise_token,
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
+            response = self._post_with_idaas_token(url, data)
             response.raise_for_status()
 
             result = response.json()
@@ -109,9 +109,6 @@ class AccountCreationService:
     def _create_welink_account(self, person: HrPerson, department_code: str) -> Dict[str, Any]:
         """创建 Welink 账号"""
         try:
-            # 获取 Welink token
-            welink_token = self._get_welink_token()
-
             # 获取部门映射
             department_mapping = self._get_department_mapping(department_code)
 
@@ -126,18 +123,14 @@ class AccountCreationService:
                 "mobileNumber": person.telephone_number1 or person.telephone_number2 or "",
                 "corpDeptCodes": [department_mapping.idaas_departmentcode] if department_mapping else ["WW10010"],
                 "personType": welink_person_type,
-                "userEmail": self._generate_unique_email(person.full_name, person.employee_number, person.person_type),
+                "userEmail": self._generate_unique_email(person),
                 "employeeId": person.employee_number
             }
 
             # 发送创建请求
             url = "https://open.welink.huaweicloud.com/api/contact/v1/user/create"
-            headers = {
-                'x-wlk-Authorization': welink_token,
-                'Content-Type': 'application/json'
-            }
 
-            response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
+            response = self._post_with_welink_token(url, data)
             response.raise_for_status()
 
             result = response.json()
@@ -157,20 +150,41 @@ class AccountCreationService:
             logger.error(f"创建 Welink 账号失败: {person.employee_number}, 错误: {e}")
             raise
 
+    def create_email_accounts(self, persons: List[HrPerson]) -> Dict[int, Any]:
+        """批量启用邮箱账号，返回 {person_id: 结果字典或异常}，外部服务熔断时抛出 CircuitOpenError
+
+        响应中找不到对应项的人员返回 MailboxResultUnknown，由调用方推迟确认，推迟次数达到上限前不计为失败。
+        """
+        return self._get_breaker('email').call(self._enable_mailboxes, persons)
+
     def _create_email_account(self, person: HrPerson) -> Dict[str, Any]:
         """启用邮箱账号"""
+        result = self._enable_mailboxes([person])[person.pk]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _enable_mailboxes(self, persons: List[HrPerson]) -> Dict[int, Any]:
+        """一次 EnableMailboxList 请求启用多个邮箱，按 SAMAccountName 将每项结果对应回人员"""
         try:
             # 获取邮箱地址（应该已经在 IDAAS 创建时生成）
-            email = self._generate_unique_email(person.full_name, person.employee_number, person.person_type)
-            username = self._generate_username(person.employee_number, person.full_name)
+            entries = {}
+            for person in persons:
+                username = self._get_username(person)
+                entries[username] = {
+                    'person': person,
+                    'email': self._generate_unique_email(person),
+                    'alias': self._get_mail_alias(person),
+                }
 
             # 构建请求数据
             data = {
                 "EnableMailboxList": [
                     {
                         "SAMAccountName": username,
-                        "Alias": self._convert_to_pinyin(person.full_name).lower()
+                        "Alias": entry['alias']
                     }
+                    for username, entry in entries.items()
                 ]
             }
 
@@ -181,43 +195,77 @@ class AccountCreationService:
                 'Content-Type': 'application/json'
             }
 
-            response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
+            response = self.transport.post(url, json=data, headers=headers)
             response.raise_for_status()
 
             result = response.json()
 
-            # 检查响应中的jsonValue来判断成功或失败
-            json_value = result.get('jsonValue', {})
-            success_items = json_value.get('success', [])
-            fail_items = json_value.get('fail', [])
-
-            # 如果fail数组有值，则创建失败
-            if fail_items:
-                raise Exception(f"邮箱创建失败: {fail_items}")
-
-            # 如果success数组有值，则创建成功
-            if not success_items:
-                raise Exception(f"邮箱服务 API 返回未知状态: {result}")
-
-            return {
-                'account_identifier': email,
-                'username': username,
-                'alias': self._convert_to_pinyin(person.full_name).lower(),
-                'service_response': result
-            }
-
         except Exception as e:
-            logger.error(f"启用邮箱账号失败: {person.employee_number}, 错误: {e}")
+            logger.error(f"启用邮箱账号失败: {', '.join(person.employee_number for person in persons)}, 错误: {e}")
             raise
 
-    def _get_idaas_enterprise_token(self) -> str:
-        """获取 IDAAS 企业级 token"""
-        cache_key = 'idaas_enterprise_token'
-        cached_token = self._get_cached_token(cache_key)
+        # 检查响应中的jsonValue来判断每项成功或失败
+        json_value = result.get('jsonValue', {}) or {}
+        success_items = json_value.get('success', []) or []
+        fail_items = json_value.get('fail', []) or []
+        success_map = {self._get_mailbox_item_key(item): item for item in success_items}
+        fail_map = {self._get_mailbox_item_key(item): item for item in fail_items}
+
+        results = {}
+        for username, entry in entries.items():
+            person = entry['person']
+
+            if len(entries) == 1:
+                # 单个邮箱时与逐个开通的判断保持一致：fail 有值即失败，success 有值即成功
+                failed, succeeded = bool(fail_items), bool(success_items)
+                item_response = result
+            else:
+                failed, succeeded = username in fail_map, username in success_map
+                item_response = fail_map.get(username) or success_map.get(username)
+
+            if failed:
+                error = fail_map.get(username, fail_items)
+                logger.error(f"启用邮箱账号失败: {person.employee_number}, 错误: {error}")
+                results[person.pk] = Exception(f"邮箱创建失败: {error}")
+            elif not succeeded and len(entries) == 1:
+                results[person.pk] = Exception(f"邮箱服务 API 返回未知状态: {result}")
+            elif not succeeded:
+                # 请求本身成功，只是响应里没有这一项，可能已经开通，不能按失败重试计数
+                logger.warning(f"邮箱服务响应中没有 {username} 的结果: {person.employee_number}, 响应: {result}")
+                results[person.pk] = MailboxResultUnknown(f"邮箱服务响应中没有 {username} 的结果")
+            else:
+                results[person.pk] = {
+                    'account_identifier': entry['email'],
+                    'username': username,
+                    'alias': entry['alias'],
+                    'service_response': item_response
+                }
 
-        if cached_token:
-            return cached_token
+        return results
 
+    @staticmethod
+    def _get_mailbox_item_key(item) -> str:
+        """取出 success/fail 数组中每项对应的 SAMAccountName"""
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key.lower() == 'samaccountname':
+                    return str(value)
+            return ''
+        return str(item)
+
+    def _post_with_idaas_token(self, url: str, data: Dict[str, Any]):
+        """携带 IDAAS 企业级 token 发送请求，多个进程共享同一个 token，鉴权失败时换新 token 重试一次"""
+        account = ConfigService.get_config('idaas_account')
+        return get_token_store().call(
+            f'idaas_enterprise_token:{account}',
+            self._fetch_idaas_enterprise_token,
+            lambda token: self.transport.post(
+                url, json=data, headers={'Authorization': token, 'Content-Type': 'application/json'},
+            ),
+        )
+
+    def _fetch_idaas_enterprise_token(self):
+        """请求新的 IDAAS 企业级 token，返回 (token, 有效期秒数)"""
         url = "https://apig.hieds.net/api/iam/auth/enterprise-token"
         headers = {'Content-Type': 'application/json'}
 
@@ -231,29 +279,28 @@ class AccountCreationService:
             }
         }
 
-        response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
+        response = self.transport.post(url, json=data, headers=headers, idempotent=True)
         response.raise_for_status()
 
         result = response.json()
         if result.get('code') != "201":
             raise Exception(f"获取 IDAAS token 失败: {result}")
 
-        token = result['access_token']
-        expires_in = result.get('expires_in', 86399)
-
-        # 缓存 token（提前5分钟过期）
-        self._cache_token(cache_key, token, expires_in - 300)
-
-        return token
-
-    def _get_welink_token(self) -> str:
-        """获取 Welink token"""
-        cache_key = 'welink_token'
-        cached_token = self._get_cached_token(cache_key)
-
-        if cached_token:
-            return cached_token
-
+        return result['access_token'], result.get('expires_in', 86399)
+
+    def _post_with_welink_token(self, url: str, data: Dict[str, Any]):
+        """携带 Welink token 发送请求，多个进程共享同一个 token，鉴权失败时换新 token 重试一次"""
+        client_id = ConfigService.get_config('welink_client_id')
+        return get_token_store().call(
+            f'welink_token:{client_id}',
+            self._fetch_welink_token,
+            lambda token: self.transport.post(
+                url, json=data, headers={'x-wlk-Authorization': token, 'Content-Type': 'application/json'},
+            ),
+        )
+
+    def _fetch_welink_token(self):
+        """请求新的 Welink token，返回 (token, 有效期秒数)"""
         url = "https://apig.hieds.net/api/auth/v2/tickets"
         headers = {'Content-Type': 'application/json'}
 
@@ -262,72 +309,42 @@ class AccountCreationService:
             "client_secret": ConfigService.get_config('welink_client_secret')
         }
 
-        response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
+        response = self.transport.post(url, json=data, headers=headers, idempotent=True)
         response.raise_for_status()
 
         result = response.json()
         if result.get('code') != "0":
             raise Exception(f"获取 Welink token 失败: {result}")
 
-        token = result['access_token']
-        expires_in = result.get('expires_in', 7200)
-
-        # 缓存 token（提前5分钟过期）
-        self._cache_token(cache_key, token, expires_in - 300)
-
-        return token
+        return result['access_token'], result.get('expires_in', 7200)
 
     def _get_department_mapping(self, department_code: str) -> Optional[DepartmentMapping]:
-        """获取部门映射"""
-        try:
-            return DepartmentMapping.objects.get(idata_departmentcode=department_code)
-        except DepartmentMapping.DoesNotExist:
+        """获取部门映射（从进程内快照读取）"""
+        mapping = get_mapping_snapshot().get_department_mapping(department_code)
+        if mapping is None:
             logger.warning(f"未找到部门映射: {department_code}")
-            return None
+        return mapping
 
     def _get_person_type_mapping(self, person_type: str) -> Optional[PersonTypeMapping]:
-        """获取人员类型的映射配置"""
-        try:
-            return PersonTypeMapping.objects.get(person_type=person_type, is_active=True)
-        except PersonTypeMapping.DoesNotExist:
-            return None
-
-    def _convert_to_pinyin(self, chinese_name: str) -> str:
-        """将中文名转换为拼音"""
-        if not PYPINYIN_AVAILABLE:
-            # 如果没有 pypinyin，使用简单的替换
-            logger.warning("pypinyin 未安装，使用简化的拼音转换")
-            return chinese_name  # 返回原名作为降级方案
-
-        try:
-            pinyin_list = pypinyin.lazy_pinyin(chinese_name, style=pypinyin.Style.NORMAL)
-            return ''.join(pinyin_list)
-        except Exception as e:
-            logger.error(f"拼音转换失败: {chinese_name}, 错误: {e}")
-            return chinese_name
+        """获取人员类型的映射配置（从进程内快照读取）"""
+        return get_mapping_snapshot().get_person_type_mapping(person_type)
 
-    def _generate_username(self, employee_number: str, full_name: str) -> str:
-        """生成用户名：姓名首字母 + 员工编号"""
-        if not PYPINYIN_AVAILABLE:
-            logger.warning("pypinyin 未安装，无法生成拼音用户名")
-            return f"{employee_number}"
+    def _get_name_pinyin(self, person: HrPerson) -> str:
+        """全名拼音，优先使用入库时预先计算的值"""
+        return person.name_pinyin or convert_to_pinyin(person.full_name)
 
-        try:
-            # 获取拼音列表 ['zhang', 'san']
-            pinyin_list = pypinyin.lazy_pinyin(full_name, style=pypinyin.Style.NORMAL)
-            # 只取第一个字的首字母
-            first_initial = pinyin_list[0][0] if pinyin_list and pinyin_list[0] else ''
-            return f"{first_initial}{employee_number}"
-        except Exception as e:
-            logger.error(f"用户名生成失败: {full_name}, 错误: {e}")
-            return f"{employee_number}"
+    def _get_username(self, person: HrPerson) -> str:
+        """用户名：姓名首字母 + 员工编号，优先使用入库时预先计算的值"""
+        return person.account_username or generate_username(person.employee_number, person.full_name)
 
-    def _generate_unique_email(self, full_name: str, employee_number: str, person_type: str) -> str:
-        """根据人员类型生成唯一的邮箱地址"""
-        base_email = self._convert_to_pinyin(full_name).lower()
+    def _get_mail_alias(self, person: HrPerson) -> str:
+        """邮箱别名，优先使用入库时预先计算的值"""
+        return person.mail_alias or self._get_name_pinyin(person).lower()
 
+    def _generate_unique_email(self, person: HrPerson) -> str:
+        """根据人员类型分配唯一的邮箱地址，同一人员的各类账号使用同一个地址"""
         # 根据人员类型获取映射配置
-        mapping = self._get_person_type_mapping(person_type)
+        mapping = self._get_person_type_mapping(person.person_type)
 
         # 获取邮箱域名：优先使用映射表，否则使用默认配置
         if mapping and mapping.email_domain:
@@ -335,83 +352,66 @@ class AccountCreationService:
         else:
             domain = ConfigService.get_config('default_email_domain', '@qq.com')
 
-        # 检查是否存在相同拼音的人
-        existing_emails = set()
-        persons_with_same_pinyin = HrPerson.objects.filter(
-            person_pinyin_name__icontains=base_email.split('.')[0]
-        ).exclude(employee_number=employee_number)
-
-        for person in persons_with_same_pinyin:
-            if person.email_address and person.email_address.startswith(base_email.split('.')[0]):
-                existing_emails.add(person.email_address)
-
-        # 生成唯一邮箱
-        if f"{base_email}{domain}" not in existing_emails:
-            return f"{base_email}{domain}"
-
-        # 如果有重复，添加序号
-        counter = 2
-        while True:
-            candidate = f"{base_email}{counter}{domain}"
-            if candidate not in existing_emails:
-                return candidate
-            counter += 1
-
-    def _get_cached_token(self, cache_key: str) -> Optional[str]:
-        """获取缓存的 token"""
-        if cache_key in self._token_cache:
-            token_data = self._token_cache[cache_key]
-            if timezone.now() < token_data['expires_at']:
-                return token_data['token']
-            else:
-                # token 已过期，删除缓存
-                del self._token_cache[cache_key]
-        return None
-
-    def _cache_token(self, cache_key: str, token: str, expires_in: int):
-        """缓存 token"""
-        self._token_cache[cache_key] = {
-            'token': token,
-            'expires_at': timezone.now() + timedelta(seconds=expires_in)
-        }
+        return EmailAllocation.allocate(person, self._get_mail_alias(person), domain).email
 
 
 class ConfigService:
-    """配置管理服务 - 统一管理SyncConfig和环境变量"""
+    """配置管理服务 - 统一管理SyncConfig和环境变量
+
+    SyncConfig 的值从进程内配置缓存读取（见 syncservice.caches.ConfigCache），
+    需要读取最新值的状态键请直接使用 SyncConfig.get_config。
+    """
 
     @staticmethod
     def get_config(key: str, default: str = None) -> str:
         """获取配置值，优先从SyncConfig获取，后备到环境变量"""
-        try:
-            config = SyncConfig.objects.get(key=key)
-            return config.value
-        except SyncConfig.DoesNotExist:
-            # 后备到环境变量（保持向后兼容）
-            env_key = key.upper()
-            return os.getenv(env_key, default)
+        value = get_config_cache().get(key)
+        if value is not None:
+            return value
+        # 后备到环境变量（保持向后兼容）
+        env_key = key.upper()
+        return os.getenv(env_key, default)
 
     @staticmethod
     def get_bool_config(key: str, default: bool = False) -> bool:
         """获取布尔配置"""
-        value = ConfigService.get_config(key, str(default).lower())
-        return value.lower() == 'true'
+        value = get_config_cache().get_parsed(key, _parse_bool)
+        if value is ConfigCache.MISSING:
+            value = _parse_bool(ConfigService.get_config(key, str(default).lower()))
+        return value
 
     @staticmethod
     def get_int_config(key: str, default: int = 0) -> int:
         """获取整数配置"""
-        value = ConfigService.get_config(key, str(default))
-        try:
-            return int(value)
-        except (ValueError, TypeError):
-            return default
+        return ConfigService._get_parsed_config(key, int, default)
+
+    @staticmethod
+    def get_float_config(key: str, default: float = 0.0) -> float:
+        """获取浮点数配置"""
+        return ConfigService._get_parsed_config(key, float, default)
 
     @staticmethod
     def get_json_config(key: str, default: Any = None) -> Any:
         """获取JSON配置"""
-        value = ConfigService.get_config(key)
-        if value:
+        value = ConfigService._get_parsed_config(key, json.loads, default)
+        # 解析结果在缓存中共享，返回副本避免调用方修改
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    @staticmethod
+    def _get_parsed_config(key: str, parse, default: Any) -> Any:
+        """从配置缓存读取解析后的值，表中没有时后备到环境变量，解析失败返回默认值"""
+        value = get_config_cache().get_parsed(key, parse)
+        if value is not ConfigCache.MISSING:
+            return value
+
+        raw_value = os.getenv(key.upper()) if get_config_cache().get(key) is None else None
+        if raw_value:
             try:
-                return json.loads(value)
-            except json.JSONDecodeError:
+                return parse(raw_value)
+            except (ValueError, TypeError):
                 pass
         return default
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() == 'true'
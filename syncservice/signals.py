@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from syncservice.caches import get_config_cache, invalidate_mapping_snapshot
+from syncservice.models import DepartmentMapping, PersonTypeMapping, SyncConfig
+
+
+@receiver([post_save, post_delete], sender=DepartmentMapping)
+@receiver([post_save, post_delete], sender=PersonTypeMapping)
+def mapping_changed(sender, **kwargs):
+    """映射变更提交后更新版本号，bulk_create/update 不触发信号，需要自行调用 invalidate_mapping_snapshot"""
+    transaction.on_commit(invalidate_mapping_snapshot)
+
+
+@receiver([post_save, post_delete], sender=SyncConfig)
+def config_changed(sender, **kwargs):
+    """配置变更提交后作废本进程的配置缓存，其他进程在缓存过期后读到新值"""
+    transaction.on_commit(get_config_cache().invalidate)
@@ -1,7 +1,8 @@
 from celery import shared_task
 from django.core.management import call_command
 import logging
-from syncservice.models import SyncConfig
+from syncservice.models import AccountCreationTask
+from syncservice.services import ConfigService
 
 logger = logging.getLogger(__name__)
 
@@ -10,8 +11,7 @@ logger = logging.getLogger(__name__)
 def sync_hr_persons_task():
     """同步HR人员数据的定时任务"""
     # 检查是否启用HR同步
-    config_value = SyncConfig.get_config('hr_sync_enabled', 'true')
-    if config_value.lower() != 'true':
+    if not ConfigService.get_bool_config('hr_sync_enabled', True):
         logger.info("HR数据同步已禁用，跳过执行")
         return "HR数据同步已禁用"
 
@@ -29,8 +29,7 @@ def sync_hr_persons_task():
 def create_account_tasks_task():
     """创建账号任务的定时任务"""
     # 检查是否启用任务自动创建
-    config_value = SyncConfig.get_config('task_auto_creation_enabled', 'true')
-    if config_value.lower() != 'true':
+    if not ConfigService.get_bool_config('task_auto_creation_enabled', True):
         logger.info("账号任务自动创建已禁用，跳过执行")
         return "账号任务自动创建已禁用"
 
@@ -48,8 +47,7 @@ def create_account_tasks_task():
 def process_account_creation_tasks_task():
     """处理账号创建任务的定时任务"""
     # 检查是否启用任务处理
-    config_value = SyncConfig.get_config('task_processing_enabled', 'true')
-    if config_value.lower() != 'true':
+    if not ConfigService.get_bool_config('task_processing_enabled', True):
         logger.info("账号创建任务处理已禁用，跳过执行")
         return "账号创建任务处理已禁用"
 
@@ -60,4 +58,17 @@ def process_account_creation_tasks_task():
         return "账号创建任务处理成功"
     except Exception as e:
         logger.error(f"账号创建任务处理定时任务失败: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+@shared_task
+def reap_expired_task_leases_task():
+    """回收租约过期的账号创建任务的定时任务"""
+    try:
+        reaped = AccountCreationTask.reap_expired_leases()
+        if reaped:
+            logger.warning(f"回收租约过期的账号创建任务 {reaped} 个")
+        return f"回收租约过期任务 {reaped} 个"
+    except Exception as e:
+        logger.error(f"回收租约过期任务失败: {e}")
+        raise
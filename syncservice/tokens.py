@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+
+from django.db.models import Q
+from django.utils import timezone
+
+from syncservice.models import ServiceToken
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefreshTimeout(Exception):
+    """等待其他进程刷新 token 超时"""
+
+
+class TokenStore:
+    """跨进程共享的外部服务 token 存储
+
+    token 保存在 ServiceToken 表中，进程内另有一层内存缓存，超过 local_ttl_seconds 后重新读库，
+    后台作废或其他进程刷新的 token 在该时间内生效。距过期不足 refresh_margin_seconds 时提前刷新，
+    刷新前比较并交换抢占刷新锁，只有抢到锁的调用会请求新 token；
+    其他调用在旧 token 未过期时继续使用旧 token，否则等待刷新完成。
+    """
+
+    # 外部服务返回这些状态码时视为 token 已失效
+    AUTH_FAILURE_STATUS_CODES = (401, 403)
+
+    def __init__(self, refresh_margin_seconds: float = 300, lock_seconds: float = 30,
+                 local_ttl_seconds: float = 30, wait_timeout: float = 30, poll_interval: float = 0.2):
+        self.refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        self.lock_seconds = lock_seconds
+        self.local_ttl_seconds = local_ttl_seconds
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        # name -> (token, 过期时间, 本地缓存到期的 monotonic 时间)
+        self._local: Dict[str, Tuple[str, datetime, float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> 'TokenStore':
+        """根据 SyncConfig 创建 token 存储"""
+        from syncservice.services import ConfigService
+        return cls(
+            refresh_margin_seconds=ConfigService.get_float_config('token_refresh_margin_seconds', 300),
+            lock_seconds=ConfigService.get_float_config('token_refresh_lock_seconds', 30),
+            local_ttl_seconds=ConfigService.get_float_config('token_local_cache_seconds', 30),
+        )
+
+    def get(self, name: str, fetch: Callable[[], Tuple[str, int]]) -> str:
+        """获取 token，需要刷新时调用 fetch，fetch 返回 (token, 有效期秒数)"""
+        token = self._get_local(name)
+        if token:
+            return token
+
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            row = self._get_row(name)
+            now = timezone.now()
+            if self._is_fresh(row.expires_at, now) and row.token:
+                self._set_local(name, row.token, row.expires_at)
+                return row.token
+
+            if self._acquire(row, now):
+                return self._refresh(row, fetch)
+
+            # 其他进程正在刷新，旧 token 还没过期就先继续使用
+            if row.token and row.expires_at and row.expires_at > now:
+                return row.token
+
+            if time.monotonic() >= deadline:
+                raise TokenRefreshTimeout(f'等待 {name} 刷新超时')
+            time.sleep(self.poll_interval)
+
+    def call(self, name: str, fetch: Callable[[], Tuple[str, int]],
+             send: Callable[[str], requests.Response]) -> requests.Response:
+        """用 token 发送请求，返回 401/403 时作废该 token，换新 token 重试一次"""
+        token = self.get(name, fetch)
+        response = send(token)
+        if response.status_code not in self.AUTH_FAILURE_STATUS_CODES:
+            return response
+
+        logger.warning(f'{name} 鉴权失败 (HTTP {response.status_code})，作废 token 后重试')
+        response.close()
+        self.invalidate(name, token)
+        return send(self.get(name, fetch))
+
+    def invalidate(self, name: str, token: str = None):
+        """作废 token，下次获取时重新请求
+
+        指定 token 时只作废该 token，其他进程已经换上的新 token 不受影响。
+        """
+        with self._lock:
+            cached = self._local.get(name)
+            if cached and (token is None or cached[0] == token):
+                del self._local[name]
+
+        rows = ServiceToken.objects.filter(name=name)
+        if token is not None:
+            rows = rows.filter(token=token)
+        rows.update(token=None, expires_at=None, updated_at=timezone.now())
+
+    def _refresh(self, row: ServiceToken, fetch: Callable[[], Tuple[str, int]]) -> str:
+        """持有刷新锁时请求新 token，失败时释放锁"""
+        try:
+            token, expires_in = fetch()
+        except Exception:
+            ServiceToken.objects.filter(pk=row.pk).update(refresh_lock_until=None, updated_at=timezone.now())
+            raise
+
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=expires_in)
+        ServiceToken.objects.filter(pk=row.pk).update(
+            token=token, expires_at=expires_at, refresh_lock_until=None, refreshed_at=now, updated_at=now
+        )
+        self._set_local(row.name, token, expires_at)
+        logger.info(f'{row.name} 已刷新，有效期 {expires_in} 秒')
+        return token
+
+    def _acquire(self, row: ServiceToken, now: datetime) -> bool:
+        """比较并交换抢占刷新锁，锁已过期视为无人持有"""
+        return bool(
+            ServiceToken.objects.filter(pk=row.pk)
+            .filter(Q(refresh_lock_until__isnull=True) | Q(refresh_lock_until__lt=now))
+            .update(refresh_lock_until=now + timedelta(seconds=self.lock_seconds), updated_at=now)
+        )
+
+    def _is_fresh(self, expires_at: Optional[datetime], now: datetime) -> bool:
+        return expires_at is not None and expires_at - self.refresh_margin > now
+
+    def _get_row(self, name: str) -> ServiceToken:
+        row, _ = ServiceToken.objects.get_or_create(name=name)
+        return row
+
+    def _get_local(self, name: str) -> Optional[str]:
+        with self._lock:
+            cached = self._local.get(name)
+        if cached and time.monotonic() < cached[2] and self._is_fresh(cached[1], timezone.now()):
+            return cached[0]
+        return None
+
+    def _set_local(self, name: str, token: str, expires_at: datetime):
+        with self._lock:
+            self._local[name] = (token, expires_at, time.monotonic() + self.local_ttl_seconds)
+
+
+_store: Optional[TokenStore] = None
+_store_lock = threading.Lock()
+
+
+def get_token_store() -> TokenStore:
+    """获取进程内共享的 token 存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TokenStore.from_config()
+    return _store
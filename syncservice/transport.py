@@ -0,0 +1,182 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class HttpTransport:
+    """出站 HTTP 传输层 - 按主机复用带连接池的 Session，统一超时与重试"""
+
+    # 这些状态码通常是网关或上游暂时不可用，可以安全重试
+    RETRY_STATUS_CODES = (502, 503, 504)
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 10, connect_timeout: float = 5,
+                 read_timeout: float = 30, max_retries: int = 2, retry_backoff: float = 0.5):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        self._retries = 0
+
+    @classmethod
+    def from_config(cls) -> 'HttpTransport':
+        """根据 SyncConfig 创建传输层"""
+        from syncservice.services import ConfigService
+        return cls(
+            pool_connections=ConfigService.get_int_config('http_pool_connections', 4),
+            pool_maxsize=ConfigService.get_int_config('http_pool_maxsize', 10),
+            connect_timeout=ConfigService.get_float_config('http_connect_timeout', 5),
+            read_timeout=ConfigService.get_float_config('http_read_timeout', 30),
+            max_retries=ConfigService.get_int_config('http_max_retries', 2),
+            retry_backoff=ConfigService.get_float_config('http_retry_backoff', 0.5),
+        )
+
+    def post(self, url: str, timeout: float = None, idempotent: bool = False, **kwargs) -> requests.Response:
+        """发送 POST 请求"""
+        return self.request('POST', url, timeout=timeout, idempotent=idempotent, **kwargs)
+
+    def request(self, method: str, url: str, timeout: float = None, idempotent: bool = None,
+                **kwargs) -> requests.Response:
+        """发送请求
+
+        连接建立失败时总是重试（请求尚未发出）；读超时和 5xx 只在幂等请求上重试，
+        避免开户之类的非幂等调用被重复执行。idempotent 为 None 时按请求方法判断。
+        """
+        if idempotent is None:
+            idempotent = method.upper() in ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+        session = self._get_session(url)
+        request_timeout = (self.connect_timeout, timeout or self.read_timeout)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = session.request(method, url, timeout=request_timeout, **kwargs)
+            except requests.ConnectionError as e:
+                # ConnectTimeout 是 ConnectionError 的子类；ReadTimeout 不是
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout) or self._is_connect_failure(e)
+                if not retryable or attempt > self.max_retries:
+                    raise
+                self._sleep_before_retry(method, url, attempt, e)
+                continue
+            except requests.Timeout as e:
+                if not idempotent or attempt > self.max_retries:
+                    raise
+                self._sleep_before_retry(method, url, attempt, e)
+                continue
+
+            if idempotent and response.status_code in self.RETRY_STATUS_CODES and attempt <= self.max_retries:
+                response.close()
+                self._sleep_before_retry(method, url, attempt, f'HTTP {response.status_code}')
+                continue
+
+            return response
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """按主机统计连接复用情况：新建连接数、请求数、复用次数"""
+        result = {}
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        for host, session in sessions:
+            connections = 0
+            requests_sent = 0
+            # http:// 与 https:// 挂载的是同一个 adapter，避免重复统计
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+
+            result[host] = {
+                'connections': connections,
+                'requests': requests_sent,
+                'reused': max(requests_sent - connections, 0),
+            }
+
+        return result
+
+    @property
+    def retry_count(self) -> int:
+        return self._retries
+
+    def close(self):
+        """关闭所有 Session"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _get_session(self, url: str) -> requests.Session:
+        """获取目标主机对应的 Session，不存在时创建"""
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _is_connect_failure(self, error: Exception) -> bool:
+        """判断是否为连接建立阶段的失败（请求未发出，重试安全）"""
+        from urllib3.exceptions import NewConnectionError
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _sleep_before_retry(self, method: str, url: str, attempt: int, reason):
+        """指数退避 + 抖动"""
+        self._retries += 1
+        delay = self.retry_backoff * (2 ** (attempt - 1))
+        delay = random.uniform(0, delay) + delay / 2
+        logger.warning(f'{method} {url} 第{attempt}次请求失败，{delay:.2f}秒后重试: {reason}')
+        time.sleep(delay)
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """获取进程内共享的传输层实例"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport.from_config()
+    return _transport
+
+
+def format_stats(stats: Dict[str, Dict[str, int]]) -> str:
+    """格式化连接复用统计，用于命令输出和日志"""
+    if not stats:
+        return '无出站连接'
+    return '; '.join(
+        f"{host}: 请求 {item['requests']} 次，新建连接 {item['connections']} 个，复用 {item['reused']} 次"
+        for host, item in stats.items()
+    )
@@ -18,7 +18,7 @@ from syncservice.serializer import (
     SyncConfigSerializer, SyncStatusSerializer,
     DepartmentMappingSerializer, AccountCreationRequestSerializer,
     AccountCreationTaskSerializer, UserCreationDataSerializer,
-    AccountCreationLogSerializer, TaskExecutionSerializer,
+    AccountCreationLogSerializer, AccountCreationLogDetailSerializer, TaskExecutionSerializer,
     AccountCreationRequestDetailSerializer, AccountCreationRequestItemSerializer
 )
 
@@ -130,6 +130,14 @@ class AccountCreationViewSet(ModelViewSet):
     ordering_fields = ['created_at', 'updated_at', 'status']
     ordering = ['-created_at']
 
+    @extend_schema(responses={200: AccountCreationLogDetailSerializer(many=True)})
+    @action(detail=True, methods=['get'], filter_backends=[], pagination_class=None)
+    def error_logs(self, request, pk=None):
+        """获取任务的错误日志，包含按需加载的完整错误详情"""
+        task = self.get_object()
+        serializer = AccountCreationLogDetailSerializer(task.error_logs.all(), many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['post'])
     def create_accounts(self, request):
         """批量创建账号 - 接收请求并写入缓冲区，由定时任务统一处理"""